@@ -1,21 +1,50 @@
 #TODO: verificare funzionamemto
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-import tensorflow as tf
 import numpy as np
-import librosa
 import joblib
 import os
-import tempfile
 import uvicorn
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
+from batching import MicroBatcher
+from cache import LRUCache, make_cache_key
+from executor import ExecutorBusy, InferenceExecutor
+from features import FeatureScaler, MelFeatureExtractor, verify_against_librosa, verify_against_scaler
+from inference import benchmark_inference, default_artifact_path, load_backend
+import pipeline
 
 # Configurazione
 PORT = int(os.getenv("EMOTION_PREDICTOR_PORT", 5002))
 MODEL_PATH = os.getenv("MODEL_PATH", "./model/emotion_classifier.keras")
 SCALER_PATH = os.getenv("SCALER_PATH", "./model/scaler.pkl")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")  # keras, tflite, onnx
+# Variante esportata da model_tools.py (none, float16, int8): sceglie il nome dell'artefatto predefinito
+INFERENCE_QUANTIZE = os.getenv("INFERENCE_QUANTIZE", "none")
+# Artefatto esportato per tflite/onnx (predefinito: accanto a MODEL_PATH, es. emotion_classifier_int8.tflite)
+BACKEND_MODEL_PATH = os.getenv("BACKEND_MODEL_PATH") or default_artifact_path(
+    INFERENCE_BACKEND, MODEL_PATH, INFERENCE_QUANTIZE
+)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0)) or None
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "compiled")  # compiled, keras (solo backend keras)
+# Confronto compiled/keras all'avvio (diagnostica): disattivato in produzione
+INFERENCE_BENCHMARK_ITERS = int(os.getenv("INFERENCE_BENCHMARK_ITERS", 0))
+FEATURE_ENGINE = os.getenv("FEATURE_ENGINE", "numpy")  # numpy, librosa
+FEATURE_TOLERANCE_DB = float(os.getenv("FEATURE_TOLERANCE_DB", 0.01))
+TIMELINE_WINDOW_SECONDS = float(os.getenv("TIMELINE_WINDOW_SECONDS", 3.0))
+TIMELINE_HOP_SECONDS = float(os.getenv("TIMELINE_HOP_SECONDS", 1.5))
+TIMELINE_MIN_WINDOW_SECONDS = float(os.getenv("TIMELINE_MIN_WINDOW_SECONDS", 1.0))
+TIMELINE_MAX_SECONDS = float(os.getenv("TIMELINE_MAX_SECONDS", 600))
+TIMELINE_CHUNK_WINDOWS = int(os.getenv("TIMELINE_CHUNK_WINDOWS", 16))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 64))
+EXECUTOR_KIND = os.getenv("EXECUTOR_KIND", "thread")  # thread, process
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 2))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", 32))
+SAMPLE_RATE = 16000
 
 # Configurazione logging
 logging.basicConfig(
@@ -27,15 +56,106 @@ logger = logging.getLogger(__name__)
 
 # Caricamento modello e scaler
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    model = load_backend(
+        INFERENCE_BACKEND,
+        BACKEND_MODEL_PATH,
+        compiled=INFERENCE_MODE == "compiled",
+        num_threads=INFERENCE_THREADS,
+    )
     scaler = joblib.load(SCALER_PATH)
-    print(f"Modello caricato da: {MODEL_PATH}")
+    print(f"Modello caricato da: {BACKEND_MODEL_PATH} (backend {INFERENCE_BACKEND})")
     print(f"Scaler caricato da: {SCALER_PATH}")
 except Exception as e:
     print(f"Errore nel caricamento del modello o dello scaler: {e}")
     model = None
     scaler = None
 
+# Warm-up del backend all'avvio (per Keras: funzione di serving compilata a firma fissa)
+inference_stats: Dict[str, Any] = {}
+if model is not None:
+    try:
+        model.warmup(batch_sizes=sorted({1, BATCH_MAX_SIZE}))
+        inference_stats.update(model.info())
+        logger.info(
+            f"Backend {model.name} pronto in {model.load_seconds * 1000:.1f} ms "
+            f"(warm-up {model.warmup_seconds * 1000:.1f} ms)"
+        )
+        if INFERENCE_BENCHMARK_ITERS > 0 and getattr(model, "compiled", None) is not None:
+            inference_stats["benchmark"] = benchmark_inference(model.model, model.compiled, INFERENCE_BENCHMARK_ITERS)
+    except Exception as e:
+        logger.error(f"Errore durante il warm-up del backend {INFERENCE_BACKEND}: {e}")
+
+# Estrattore mel vettorizzato: verificato all'avvio contro la pipeline librosa
+mel_extractor = None
+if FEATURE_ENGINE == "numpy":
+    try:
+        mel_extractor = MelFeatureExtractor()
+        max_diff = verify_against_librosa(mel_extractor, tolerance_db=FEATURE_TOLERANCE_DB)
+        logger.info(f"Estrattore mel NumPy attivo (differenza massima da librosa: {max_diff:.5f} dB)")
+    except Exception as e:
+        logger.error(f"Estrattore mel NumPy non utilizzabile, uso librosa: {e}")
+        mel_extractor = None
+
+# Standardizzazione fusa: media e scala dello scaler applicate in place sul batch
+feature_scaler = None
+if scaler is not None:
+    try:
+        feature_scaler = FeatureScaler(scaler)
+        max_diff = verify_against_scaler(feature_scaler, scaler)
+        logger.info(f"Standardizzazione fusa attiva (differenza massima da scaler.transform: {max_diff:.2e})")
+    except Exception as e:
+        logger.error(f"Standardizzazione fusa non utilizzabile, uso scaler.transform: {e}")
+        feature_scaler = None
+
+
+# Cache delle features scalate e delle risposte, indicizzata per contenuto dell'audio
+prediction_cache = LRUCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=int(CACHE_MAX_MB * 1024 * 1024))
+
+# Parametri che determinano le features: cambiandoli cambia anche la chiave della cache
+FEATURE_PARAMS = {
+    "sr": SAMPLE_RATE,
+    "offset": 0.5,
+    "duration": 3,
+    "n_fft": 2048,
+    "hop_length": 512,
+    "n_mels": 128,
+    "n_frames": 94,
+    "model": BACKEND_MODEL_PATH,
+    "scaler": SCALER_PATH,
+}
+
+# Stato della pipeline nel processo principale (modalità "thread")
+pipeline.configure(model, scaler, feature_scaler, mel_extractor)
+
+# Executor per decodifica e features: il lavoro CPU-bound non blocca l'event loop.
+# In modalità "process" ogni figlio carica modello e scaler una volta sola nell'initializer
+cpu_executor = InferenceExecutor(
+    EXECUTOR_KIND,
+    EXECUTOR_WORKERS,
+    EXECUTOR_QUEUE_SIZE,
+    name="emotion",
+    initializer=pipeline.init_worker if EXECUTOR_KIND == "process" else None,
+    initargs=(
+        INFERENCE_BACKEND,
+        BACKEND_MODEL_PATH,
+        SCALER_PATH,
+        INFERENCE_MODE == "compiled",
+        INFERENCE_THREADS,
+        feature_scaler is not None,
+        mel_extractor is not None,
+    ),
+)
+
+# Scheduler che raggruppa le richieste concorrenti in un unico forward pass.
+# In modalità "process" anche il modello gira nei processi del pool, passando dal limite
+# di richieste in corso dell'executor (ExecutorBusy -> 503)
+batcher = MicroBatcher(
+    pipeline.run_model,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    runner=cpu_executor.run if EXECUTOR_KIND == "process" else None,
+)
+
 app = FastAPI(title="Emotion Predictor Service")
 
 # Configurare CORS
@@ -68,41 +188,54 @@ class EmotionResponse(BaseModel):
     probabilities: Dict[str, float]
 
 
-def extract_mel_features(audio_data, sr=16000):
-    try:
-        logger.info(f"Estrazione delle features dal file audio: {audio_data}")
-        y, sr = librosa.load(audio_data, sr=sr, duration=3, offset=0.5)
-        logger.info(f"Audio caricato con shape: {y.shape}")
-        mel_spectrogram = librosa.feature.melspectrogram(
-            y=y,
-            sr=sr,
-            n_fft=2048,
-            hop_length=512,
-            n_mels=128
-        )
+class EmotionWindow(BaseModel):
+    start: float
+    end: float
+    emotion: str
+    confidence: float
+    probabilities: Dict[str, float]
 
-        # Conversione in decibel
-        logger.info(f"Mel spectrogram shape: {mel_spectrogram.shape}")
-        mel_spectrogram_db = librosa.power_to_db(mel_spectrogram, ref=np.max)
-
-        expected_width = 94
-        current_width = mel_spectrogram_db.shape[1]
-        logger.info(f"Mel spectrogram shape dopo conversione in dB: {mel_spectrogram_db.shape}")
-        if current_width < expected_width:
-            # Padding se necessario
-            logger.info(f"Padding del mel spectrogram da {current_width} a {expected_width}")
-            pad_width = expected_width - current_width
-            mel_spectrogram_db = np.pad(mel_spectrogram_db, ((0, 0), (0, pad_width)), mode='constant')
-        elif current_width > expected_width:
-            # Troncamento se necessario
-            logger.info(f"Troncamento del mel spectrogram da {current_width} a {expected_width}")
-            mel_spectrogram_db = mel_spectrogram_db[:, :expected_width]
-
-        return mel_spectrogram_db
 
-    except Exception as e:
-        print(f"Errore durante l'estrazione delle features: {e}")
-        return None
+class EmotionTimelineResponse(EmotionResponse):
+    duration: float
+    truncated: bool = False
+    windows: List[EmotionWindow]
+
+
+def format_prediction(probs):
+    """Converte una riga di probabilità del modello nella risposta dell'API."""
+    predicted_class = int(np.argmax(probs))
+    return {
+        "emotion": EMOTION_MAP.get(predicted_class, "neutral"),
+        "confidence": float(probs[predicted_class]),
+        "probabilities": {EMOTION_MAP[i]: float(probs[i]) for i in range(len(probs))}
+    }
+
+
+def timeline_windows(n_samples, sr=SAMPLE_RATE):
+    """Restituisce gli indici di inizio delle finestre sovrapposte che coprono la clip."""
+    window = int(TIMELINE_WINDOW_SECONDS * sr)
+    hop = max(1, int(TIMELINE_HOP_SECONDS * sr))
+    if n_samples <= window:
+        return [0]
+
+    starts = list(range(0, n_samples - window + 1, hop))
+    # Coda non coperta dalle finestre piene: aggiungi una finestra parziale se abbastanza lunga
+    tail_start = starts[-1] + hop
+    if starts[-1] + window < n_samples and n_samples - tail_start >= TIMELINE_MIN_WINDOW_SECONDS * sr:
+        starts.append(tail_start)
+    return starts
+
+
+@app.on_event("startup")
+async def start_batcher():
+    await batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+    cpu_executor.shutdown()
 
 
 @app.get("/health")
@@ -112,58 +245,134 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Restituisce le metriche dello scheduler e del percorso di inferenza."""
+    return {
+        "batching": batcher.stats(),
+        "inference": inference_stats,
+        "cache": prediction_cache.stats(),
+        "executor": cpu_executor.stats(),
+    }
+
+
+@app.get("/cache")
+async def get_cache():
+    """Restituisce lo stato della cache delle predizioni."""
+    return prediction_cache.stats()
+
+
+@app.delete("/cache")
+async def flush_cache():
+    """Svuota la cache delle predizioni."""
+    removed = prediction_cache.clear()
+    logger.info(f"Cache svuotata ({removed} voci rimosse)")
+    return {"status": "flushed", "removed": removed}
+
+
 @app.post("/predict", response_model=EmotionResponse)
 async def predict_emotion(file: UploadFile = File(...)):
     if model is None or scaler is None:
         raise HTTPException(status_code=500, detail="Modello o scaler non caricati")
 
     try:
-        # Salva temporaneamente il file audio
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(await file.read())
-            temp_file_path = temp_file.name
-            logger.info(f"File audio temporaneo salvato in: {temp_file_path}")
+        contents = await file.read()
 
-        # Estrai le features
-        features = extract_mel_features(temp_file_path)
-        os.unlink(temp_file_path)
+        # Stesso audio già analizzato (es. retry del client): riusa la risposta o le features
+        cache_key = make_cache_key(contents, FEATURE_PARAMS)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None and cached["response"] is not None:
+            logger.info("Risposta servita dalla cache")
+            return cached["response"]
 
-        if features is None:
-            raise HTTPException(status_code=400, detail="Impossibile estrarre le features dal file audio")
+        if cached is not None:
+            features_final = cached["features"]
+        else:
+            # Estrai le features direttamente dai bytes caricati, fuori dall'event loop
+            features_final = await cpu_executor.run(pipeline.prepare_features, contents)
 
-        # Reshape
-        original_shape = features.shape
-        # Reshape per lo scaling (appiattisci il mel spettrogramma)
-        features_flattened = features.reshape(1, -1)  # Una singola riga con tutte le features appiattite
-        logger.info(f"Features flattened shape: {features_flattened.shape}")  # Dovrebbe essere (1, 12032)
+            if features_final is None:
+                raise HTTPException(status_code=400, detail="Impossibile estrarre le features dal file audio")
 
-        # Applica lo scaler
-        features_scaled = scaler.transform(features_flattened)
+            prediction_cache.put(cache_key, {"features": features_final, "response": None}, features_final.nbytes)
 
-        # Reshape alla forma originale
-        features_scaled = features_scaled.reshape(original_shape)
+        # Predizione: la richiesta viene raggruppata con quelle concorrenti
+        prediction = await batcher.submit(features_final)
+        result = format_prediction(prediction)
 
-        # Aggiunta delle dimensioni per batch e channel
-        features_final = np.expand_dims(features_scaled, axis=0)  # Aggiungi dimensione batch
-        features_final = np.expand_dims(features_final, axis=-1)  # Aggiungi dimensione channel
+        logger.info(f"Emozione predetta: {result['emotion']}")
+        logger.info(f"Confidence: {result['confidence']}")
+        logger.info(f"Probabilità: {result['probabilities']}")
 
-        # Predizione
-        prediction = model.predict(features_final)
-        predicted_class = np.argmax(prediction, axis=1)[0]
+        prediction_cache.put(cache_key, {"features": features_final, "response": result}, features_final.nbytes)
+        return result
 
-        probabilities = {EMOTION_MAP[i]: float(prediction[0][i]) for i in range(len(prediction[0]))}
+    except HTTPException:
+        raise
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=f"Servizio occupato, riprovare più tardi: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore durante la predizione: {str(e)}")
 
-        logger.info(f"Emozione predetta: {EMOTION_MAP.get(predicted_class, 'neutral')}")
-        logger.info(f"Confidence: {float(prediction[0][predicted_class])}")
-        logger.info(f"Probabilità: {probabilities}")
 
+@app.post("/predict/timeline", response_model=EmotionTimelineResponse)
+async def predict_emotion_timeline(file: UploadFile = File(...)):
+    """Analizza l'intera registrazione a finestre sovrapposte e restituisce la timeline delle emozioni."""
+    if model is None or scaler is None:
+        raise HTTPException(status_code=500, detail="Modello o scaler non caricati")
+
+    try:
+        # La durata massima limita la memoria occupata dalla forma d'onda
+        y = await cpu_executor.run(pipeline.load_timeline_audio, await file.read(), TIMELINE_MAX_SECONDS)
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=f"Servizio occupato, riprovare più tardi: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Impossibile decodificare il file audio: {str(e)}")
+
+    # Una finestra riempita di padding non descrive l'audio: stessa soglia della finestra finale parziale
+    if len(y) < TIMELINE_MIN_WINDOW_SECONDS * SAMPLE_RATE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio troppo breve ({len(y) / SAMPLE_RATE:.2f} s, minimo {TIMELINE_MIN_WINDOW_SECONDS:g} s)"
+        )
+
+    try:
+        window = int(TIMELINE_WINDOW_SECONDS * SAMPLE_RATE)
+        starts = timeline_windows(len(y))
+        logger.info(f"Timeline: {len(y) / SAMPLE_RATE:.1f} s di audio in {len(starts)} finestre")
+
+        # Le finestre vengono elaborate a blocchi: la memoria dipende da TIMELINE_CHUNK_WINDOWS,
+        # non dalla durata della registrazione
+        predictions = []
+        for i in range(0, len(starts), TIMELINE_CHUNK_WINDOWS):
+            chunk = starts[i:i + TIMELINE_CHUNK_WINDOWS]
+            features = await cpu_executor.run(
+                pipeline.prepare_window_batch, [y[start:start + window] for start in chunk]
+            )
+            predictions.append(await batcher.run_batch(features))
+        predictions = np.concatenate(predictions)
+
+        windows = []
+        for start, probs in zip(starts, predictions):
+            windows.append({
+                "start": start / SAMPLE_RATE,
+                "end": min(start + window, len(y)) / SAMPLE_RATE,
+                **format_prediction(probs)
+            })
+
+        # Risultato aggregato: media delle probabilità su tutte le finestre
+        result = format_prediction(predictions.mean(axis=0))
+        logger.info(f"Emozione predominante nella timeline: {result['emotion']}")
 
         return {
-            "emotion": EMOTION_MAP.get(predicted_class, "neutral"),
-            "confidence": float(prediction[0][predicted_class]),
-            "probabilities": {EMOTION_MAP[i]: float(prediction[0][i]) for i in range(len(prediction[0]))}
+            **result,
+            "duration": len(y) / SAMPLE_RATE,
+            "truncated": len(y) >= int(TIMELINE_MAX_SECONDS * SAMPLE_RATE),
+            "windows": windows
         }
 
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=f"Servizio occupato, riprovare più tardi: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore durante la predizione: {str(e)}")
 
@@ -181,4 +390,5 @@ async def predict_emotion_from_text(input_data: TextInput):
 
 if __name__ == "__main__":
     print(f"Avvio del servizio emotion-predictor sulla porta {PORT}")
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True)
\ No newline at end of file
+    # Senza reload: in produzione il servizio si avvia con `uvicorn app:app --app-dir src` (vedi Dockerfile)
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import io
+import logging
+import os
+import subprocess
+import tempfile
+from typing import Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+def load_audio(data: bytes, sr: int = 16000, offset: float = 0.0, duration: Optional[float] = None) -> np.ndarray:
+    """Decodifica l'audio caricato direttamente dai bytes, come `librosa.load`.
+
+    Ordine dei tentativi:
+    1. soundfile su buffer in memoria (WAV, FLAC, OGG): nessun accesso al disco;
+    2. ffmpeg via stdin/stdout per gli altri container (WebM, MP3, MP4...);
+    3. file temporaneo + `librosa.load`, solo come ultima risorsa.
+    """
+    try:
+        return _load_with_soundfile(data, sr, offset, duration)
+    except Exception as e:
+        logger.info(f"Decodifica in memoria non riuscita ({e}), provo con ffmpeg")
+
+    try:
+        return _load_with_ffmpeg(data, sr, offset, duration)
+    except Exception as e:
+        logger.warning(f"Decodifica con ffmpeg non riuscita ({e}), uso un file temporaneo")
+
+    return _load_with_temp_file(data, sr, offset, duration)
+
+
+def _load_with_soundfile(data, sr, offset, duration):
+    with sf.SoundFile(io.BytesIO(data)) as sf_desc:
+        sr_native = sf_desc.samplerate
+        # Stessa aritmetica di librosa.load per offset e durata
+        if offset:
+            sf_desc.seek(int(offset * sr_native))
+        frames = int(duration * sr_native) if duration is not None else -1
+        y = sf_desc.read(frames=frames, dtype="float32", always_2d=True)
+
+    y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+    if sr_native != sr:
+        y = librosa.resample(y, orig_sr=sr_native, target_sr=sr)
+    return y
+
+
+def _load_with_ffmpeg(data, sr, offset, duration):
+    # Offset e durata passati a ffmpeg: la parte oltre la durata non viene decodificata e quella
+    # prima dell'offset viene scartata senza arrivare in memoria. Opzioni di output (dopo -i):
+    # su stdin non si può cercare nell'input, e il taglio resta preciso al campione
+    trim = []
+    if offset:
+        trim += ["-ss", f"{offset:.6f}"]
+    if duration is not None:
+        trim += ["-t", f"{duration:.6f}"]
+    result = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            *trim,
+            "-f", "f32le", "-ac", "1", "-ar", str(sr),
+            "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+        check=True,
+    )
+    y = np.frombuffer(result.stdout, dtype=np.float32)
+    if y.size == 0:
+        raise ValueError("ffmpeg non ha prodotto campioni audio")
+
+    # Stessa lunghezza di librosa.load anche se ffmpeg arrotonda la durata al frame
+    if duration is not None:
+        y = y[:int(duration * sr)]
+    return y.copy()
+
+
+def _load_with_temp_file(data, sr, offset, duration):
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(data)
+        temp_file_path = temp_file.name
+    logger.info(f"File audio temporaneo salvato in: {temp_file_path}")
+
+    try:
+        y, _ = librosa.load(temp_file_path, sr=sr, duration=duration, offset=offset)
+        return y
+    finally:
+        os.unlink(temp_file_path)
@@ -0,0 +1,92 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(Exception):
+    """La coda dell'executor è piena: la richiesta va rifiutata."""
+
+
+class InferenceExecutor:
+    """Esegue il lavoro CPU-bound fuori dall'event loop con concorrenza e coda limitate.
+
+    `kind` può essere "thread" o "process". Al più `max_workers` task sono in
+    esecuzione e al più `max_queue` in attesa; oltre questo limite `run` solleva
+    `ExecutorBusy`. In modalità "process" funzione e argomenti devono essere
+    serializzabili con pickle (funzioni definite a livello di modulo, in un
+    modulo leggero): ogni processo figlio carica il proprio modello una sola
+    volta con `initializer(*initargs)`.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 1,
+        max_queue: int = 16,
+        name: str = "inference",
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple[Any, ...] = (),
+    ):
+        self.kind = kind
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+
+        if kind == "process":
+            self.executor: Executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs,
+            )
+        elif kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        else:
+            raise ValueError(f"Tipo di executor non supportato: {kind}")
+
+        # Contatori aggiornati solo dall'event loop: non servono lock
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        logger.info(
+            f"Executor '{name}' avviato (tipo={kind}, workers={self.max_workers}, coda={self.max_queue})"
+        )
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Esegue `fn(*args)` nel pool e ne attende il risultato senza bloccare l'event loop."""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"Coda piena ({self.in_flight} richieste in corso)")
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
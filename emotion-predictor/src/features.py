@@ -0,0 +1,165 @@
+import logging
+from typing import Sequence
+
+import librosa
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+
+def librosa_mel_features(y, sr=16000, n_fft=2048, hop_length=512, n_mels=128, n_frames=94):
+    """Pipeline di riferimento (librosa) usata per l'addestramento del modello."""
+    mel_spectrogram = librosa.feature.melspectrogram(
+        y=y,
+        sr=sr,
+        n_fft=n_fft,
+        hop_length=hop_length,
+        n_mels=n_mels
+    )
+    mel_spectrogram_db = librosa.power_to_db(mel_spectrogram, ref=np.max)
+
+    current_width = mel_spectrogram_db.shape[1]
+    if current_width < n_frames:
+        mel_spectrogram_db = np.pad(mel_spectrogram_db, ((0, 0), (0, n_frames - current_width)), mode='constant')
+    elif current_width > n_frames:
+        mel_spectrogram_db = mel_spectrogram_db[:, :n_frames]
+    return mel_spectrogram_db
+
+
+class MelFeatureExtractor:
+    """Mel spettrogramma in dB calcolato in NumPy vettorizzato su un batch di clip.
+
+    Finestra di Hann e banco di filtri mel vengono calcolati una sola volta.
+    Riproduce `librosa_mel_features` (STFT centrata con padding a zero,
+    potenza 2, `power_to_db(ref=np.max, top_db=80)` per clip, padding a 0 dB
+    dei frame mancanti), così modello e scaler addestrati restano validi.
+    Per clip più lunghe di `n_frames` frame il riferimento del dB è calcolato
+    solo sui frame mantenuti.
+    """
+
+    def __init__(self, sr=16000, n_fft=2048, hop_length=512, n_mels=128, n_frames=94, top_db=80.0, amin=1e-10):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.n_frames = n_frames
+        self.top_db = top_db
+        self.amin = amin
+
+        # Hann periodica, come scipy.signal.get_window('hann', n_fft) usata da librosa
+        n = np.arange(n_fft)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / n_fft)).astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+
+        # Lunghezza del segnale (già con padding centrato) necessaria per n_frames frame
+        self._padded_length = (n_frames - 1) * hop_length + n_fft
+
+    def __call__(self, clips: Sequence[np.ndarray]) -> np.ndarray:
+        """Restituisce le features di shape (len(clips), n_mels, n_frames)."""
+        pad = self.n_fft // 2
+        max_samples = self._padded_length - pad
+
+        buffer = np.zeros((len(clips), self._padded_length), dtype=np.float32)
+        n_valid = np.empty(len(clips), dtype=np.int64)
+        for i, clip in enumerate(clips):
+            clip = clip[:max_samples]
+            buffer[i, pad:pad + len(clip)] = clip
+            n_valid[i] = min(1 + len(clip) // self.hop_length, self.n_frames)
+
+        # STFT: (B, n_frames, n_fft) -> (B, n_frames, n_fft // 2 + 1)
+        frames = sliding_window_view(buffer, self.n_fft, axis=-1)[:, ::self.hop_length]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+
+        # Banco di filtri mel: (B, n_mels, n_frames)
+        mel = np.matmul(self.mel_basis, power.transpose(0, 2, 1))
+
+        # power_to_db con riferimento al massimo di ciascuna clip, sui soli frame validi
+        valid = (np.arange(self.n_frames)[None, :] < n_valid[:, None])[:, None, :]
+        ref = np.max(np.where(valid, mel, 0.0), axis=(1, 2))
+        log_spec = 10.0 * np.log10(np.maximum(self.amin, mel))
+        log_spec -= 10.0 * np.log10(np.maximum(self.amin, ref))[:, None, None]
+        if self.top_db is not None:
+            floor = np.max(np.where(valid, log_spec, -np.inf), axis=(1, 2)) - self.top_db
+            log_spec = np.maximum(log_spec, floor[:, None, None])
+
+        # I frame oltre la fine della clip valgono 0, come np.pad nella pipeline librosa
+        return np.where(valid, log_spec, 0.0).astype(np.float32)
+
+    def reference(self, y: np.ndarray) -> np.ndarray:
+        """Features della singola clip con la pipeline librosa originale."""
+        return librosa_mel_features(
+            y, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length,
+            n_mels=self.n_mels, n_frames=self.n_frames
+        )
+
+
+def verify_against_librosa(extractor: MelFeatureExtractor, tolerance_db: float = 1e-2) -> float:
+    """Confronta l'estrattore con la pipeline librosa su segnali sintetici.
+
+    Restituisce la massima differenza assoluta in dB e solleva `ValueError`
+    se supera `tolerance_db`.
+    """
+    rng = np.random.default_rng(0)
+    sr = extractor.sr
+    t = np.arange(3 * sr) / sr
+    clips = [
+        # Clip piena da 3 s: tono modulato più rumore
+        (0.5 * np.sin(2 * np.pi * (220 + 200 * t) * t) + 0.05 * rng.standard_normal(t.size)).astype(np.float32),
+        # Clip corta: verifica il padding dei frame mancanti
+        (0.1 * rng.standard_normal(sr)).astype(np.float32),
+    ]
+
+    features = extractor(clips)
+    max_diff = max(
+        float(np.max(np.abs(features[i] - extractor.reference(clip))))
+        for i, clip in enumerate(clips)
+    )
+    if max_diff > tolerance_db:
+        raise ValueError(f"Differenza massima {max_diff:.4f} dB oltre la tolleranza di {tolerance_db} dB")
+    return max_diff
+
+
+class FeatureScaler:
+    """Standardizzazione di `scaler.pkl` applicata in place su batch (N, n_mels, n_frames).
+
+    Media e deviazione standard dello `StandardScaler` vengono caricate una
+    sola volta nella forma del mel spettrogramma, così non servono né l'appiattimento
+    a (N, 12032) né la chiamata Python a `scaler.transform` per ogni richiesta.
+    """
+
+    def __init__(self, scaler, feature_shape=(128, 94)):
+        if not hasattr(scaler, "scale_") or not hasattr(scaler, "mean_"):
+            raise TypeError(f"Scaler non supportato: {type(scaler).__name__}")
+
+        self.feature_shape = tuple(feature_shape)
+        # Gli operandi restano in float64 come in scikit-learn: il risultato coincide con transform()
+        self.mean = None
+        self.scale = None
+        if getattr(scaler, "with_mean", True) and scaler.mean_ is not None:
+            self.mean = np.asarray(scaler.mean_, dtype=np.float64).reshape(self.feature_shape)
+        if getattr(scaler, "with_std", True) and scaler.scale_ is not None:
+            self.scale = np.asarray(scaler.scale_, dtype=np.float64).reshape(self.feature_shape)
+
+    def __call__(self, features: np.ndarray) -> np.ndarray:
+        """Normalizza in place `features` (float32, shape (N, n_mels, n_frames)) e lo restituisce."""
+        if self.mean is not None:
+            np.subtract(features, self.mean, out=features)
+        if self.scale is not None:
+            np.divide(features, self.scale, out=features)
+        return features
+
+
+def verify_against_scaler(feature_scaler: FeatureScaler, scaler, n_samples: int = 4, tolerance: float = 1e-5) -> float:
+    """Confronta `FeatureScaler` con `scaler.transform` e restituisce la massima differenza assoluta."""
+    rng = np.random.default_rng(0)
+    features = rng.uniform(-80.0, 0.0, size=(n_samples,) + feature_scaler.feature_shape).astype(np.float32)
+
+    expected = scaler.transform(features.reshape(n_samples, -1)).reshape(features.shape)
+    fused = feature_scaler(features.copy())
+
+    max_diff = float(np.max(np.abs(fused - expected)))
+    if not np.allclose(fused, expected, rtol=tolerance, atol=tolerance):
+        raise ValueError(f"Differenza massima {max_diff:.2e} rispetto a scaler.transform")
+    return max_diff
@@ -0,0 +1,276 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Backend supportati ed estensione dell'artefatto esportato corrispondente
+BACKEND_EXTENSIONS = {
+    "keras": ".keras",
+    "tflite": ".tflite",
+    "onnx": ".onnx",
+}
+
+
+def default_artifact_path(backend: str, model_path: str, quantize: str = "none") -> str:
+    """Percorso predefinito dell'artefatto di un backend, accanto al modello .keras.
+
+    Le varianti quantizzate hanno il suffisso `_<quantize>` (es. `emotion_classifier_int8.tflite`):
+    lo stesso schema è usato da `model_tools.py export` e dal servizio.
+    """
+    if backend == "keras":
+        return model_path
+    suffix = "" if quantize == "none" else f"_{quantize}"
+    return os.path.splitext(model_path)[0] + suffix + BACKEND_EXTENSIONS[backend]
+
+
+class InferenceBackend:
+    """Interfaccia comune dei backend: batch (N, 128, 94, 1) float32 -> probabilità (N, 6)."""
+
+    name = "base"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.input_shape: Tuple[int, ...] = (128, 94, 1)
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def warmup(self, batch_sizes: Iterable[int] = (1,)):
+        """Esegue il backend su tensori fittizi per inizializzare kernel e allocatori."""
+        start = time.perf_counter()
+        for batch_size in batch_sizes:
+            self(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+        self.warmup_seconds = time.perf_counter() - start
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "load_ms": self.load_seconds * 1000,
+            "warmup_ms": self.warmup_seconds * 1000,
+        }
+
+
+class CompiledModel:
+    """Funzione di serving tracciata una sola volta con firma di input fissa.
+
+    Evita il ciclo generico di `model.predict` (data adapter, callback, ecc.):
+    la dimensione batch resta libera per lo scheduler, le altre sono fisse.
+    """
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+
+        start = time.perf_counter()
+        self._fn = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + self.input_shape, tf.float32)],
+        )
+        self._fn.get_concrete_function()
+        self.trace_seconds = time.perf_counter() - start
+        self.warmup_seconds = 0.0
+
+    def warmup(self, batch_sizes: Iterable[int] = (1,)):
+        """Esegue la funzione su tensori fittizi per inizializzare kernel e allocatori."""
+        start = time.perf_counter()
+        for batch_size in batch_sizes:
+            self(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+        self.warmup_seconds = time.perf_counter() - start
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        import tensorflow as tf
+
+        return self._fn(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+class KerasBackend(InferenceBackend):
+    """Modello `.keras` completo, servito dalla funzione compilata o da `model.predict`."""
+
+    name = "keras"
+
+    def __init__(self, path: str, compiled: bool = True):
+        super().__init__(path)
+        import tensorflow as tf
+
+        start = time.perf_counter()
+        self.model = tf.keras.models.load_model(path)
+        self.input_shape = tuple(self.model.input_shape[1:])
+        self.compiled: Optional[CompiledModel] = None
+        if compiled:
+            try:
+                self.compiled = CompiledModel(self.model)
+            except Exception as e:
+                logger.error(f"Errore nella compilazione della funzione di serving, uso model.predict: {e}")
+        self.load_seconds = time.perf_counter() - start
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        if self.compiled is not None:
+            return self.compiled(batch)
+        return self.model.predict(batch, verbose=0)
+
+    def warmup(self, batch_sizes: Iterable[int] = (1,)):
+        if self.compiled is None:
+            return super().warmup(batch_sizes)
+        self.compiled.warmup(batch_sizes)
+        self.warmup_seconds = self.compiled.warmup_seconds
+
+    def info(self) -> Dict[str, Any]:
+        info = super().info()
+        info["mode"] = "compiled" if self.compiled is not None else "keras"
+        if self.compiled is not None:
+            info["trace_ms"] = self.compiled.trace_seconds * 1000
+        return info
+
+
+class TFLiteBackend(InferenceBackend):
+    """Modello TFLite (float o quantizzato int8) eseguito con l'interprete TFLite.
+
+    Usa `tflite_runtime` se installato, evitando l'import di TensorFlow completo.
+    """
+
+    name = "tflite"
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        super().__init__(path)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+        start = time.perf_counter()
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self._input["shape"][1:])
+        self._batch_size = int(self._input["shape"][0])
+        # L'interprete non è thread-safe
+        self._lock = threading.Lock()
+        self.load_seconds = time.perf_counter() - start
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], (len(batch),) + self.input_shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(batch)
+
+            self.interpreter.set_tensor(self._input["index"], _quantize(batch, self._input))
+            self.interpreter.invoke()
+            return _dequantize(self.interpreter.get_tensor(self._output["index"]), self._output)
+
+    def info(self) -> Dict[str, Any]:
+        info = super().info()
+        info["input_dtype"] = np.dtype(self._input["dtype"]).name
+        return info
+
+
+class ONNXBackend(InferenceBackend):
+    """Modello ONNX (float o quantizzato int8) eseguito con onnxruntime su CPU."""
+
+    name = "onnx"
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        super().__init__(path)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("Backend onnx non disponibile: installare onnxruntime (vedi requirements.txt)")
+
+        start = time.perf_counter()
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = tuple(int(d) for d in model_input.shape[1:])
+        self.load_seconds = time.perf_counter() - start
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+def _quantize(batch: np.ndarray, details: Dict[str, Any]) -> np.ndarray:
+    dtype = details["dtype"]
+    if dtype == np.float32:
+        return batch.astype(np.float32, copy=False)
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output: np.ndarray, details: Dict[str, Any]) -> np.ndarray:
+    if details["dtype"] == np.float32:
+        return output.copy()
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+def load_backend(name: str, path: str, compiled: bool = True, num_threads: Optional[int] = None) -> InferenceBackend:
+    """Carica il backend richiesto ("keras", "tflite" o "onnx") dall'artefatto indicato."""
+    if name == "keras":
+        return KerasBackend(path, compiled=compiled)
+    if name == "tflite":
+        return TFLiteBackend(path, num_threads=num_threads)
+    if name == "onnx":
+        return ONNXBackend(path, num_threads=num_threads)
+    raise ValueError(f"Backend di inferenza non supportato: {name}")
+
+
+def benchmark_inference(model, compiled: CompiledModel, iterations: int = 20) -> Dict[str, Any]:
+    """Confronta tempo di avvio e latenza per chiamata tra `model.predict` e il percorso compilato."""
+    sample = np.random.default_rng(0).standard_normal((1,) + compiled.input_shape).astype(np.float32)
+
+    # Il primo model.predict costruisce la predict function: è il costo di avvio del percorso Keras
+    start = time.perf_counter()
+    keras_output = model.predict(sample, verbose=0)
+    keras_startup = time.perf_counter() - start
+
+    keras_latencies = []
+    compiled_latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict(sample, verbose=0)
+        keras_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compiled(sample)
+        compiled_latencies.append(time.perf_counter() - start)
+
+    keras_ms = float(np.median(keras_latencies) * 1000) if keras_latencies else 0.0
+    compiled_ms = float(np.median(compiled_latencies) * 1000) if compiled_latencies else 0.0
+    results = {
+        "iterations": iterations,
+        "keras_predict": {
+            "startup_ms": keras_startup * 1000,
+            "median_call_ms": keras_ms,
+        },
+        "compiled": {
+            "startup_ms": (compiled.trace_seconds + compiled.warmup_seconds) * 1000,
+            "trace_ms": compiled.trace_seconds * 1000,
+            "warmup_ms": compiled.warmup_seconds * 1000,
+            "median_call_ms": compiled_ms,
+        },
+        "speedup": keras_ms / compiled_ms if compiled_ms else None,
+        "max_abs_diff": float(np.max(np.abs(keras_output - compiled(sample)))),
+    }
+    logger.info(
+        f"Benchmark inferenza: model.predict {keras_ms:.2f} ms/chiamata, "
+        f"compilato {compiled_ms:.2f} ms/chiamata"
+    )
+    return results
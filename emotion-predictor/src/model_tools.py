@@ -0,0 +1,204 @@
+"""Strumenti per i backend di inferenza dell'emotion-predictor.
+
+Esportazione del modello Keras in TFLite o ONNX (opzionalmente quantizzato int8):
+
+    python src/model_tools.py export --format tflite --quantize int8 --calibration-dir ./dataset
+    python src/model_tools.py export --format onnx
+
+Confronto di accuratezza e latenza tra i backend disponibili:
+
+    python src/model_tools.py compare --backends keras,tflite,onnx --audio-dir ./dataset
+
+Se `--audio-dir` contiene sottocartelle con il nome dell'emozione (es. `dataset/happy/*.wav`)
+viene calcolata anche l'accuratezza rispetto alle etichette; in ogni caso viene
+riportato l'accordo delle predizioni con il modello Keras di riferimento.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from audio_io import load_audio
+from features import FeatureScaler, MelFeatureExtractor
+from inference import default_artifact_path, load_backend
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv("MODEL_PATH", "./model/emotion_classifier.keras")
+SCALER_PATH = os.getenv("SCALER_PATH", "./model/scaler.pkl")
+
+# Stesso ordine di EMOTION_MAP nel servizio
+EMOTION_LABELS = ["angry", "disgust", "fearful", "happy", "neutral", "sad"]
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".webm")
+
+
+def load_dataset(audio_dir: Optional[str], n_samples: int) -> Tuple[np.ndarray, List[Optional[int]]]:
+    """Features scalate (N, 128, 94, 1) ed eventuali etichette dalle sottocartelle.
+
+    Senza `audio_dir` usa input casuali con distribuzione normale standard,
+    che approssima quella delle features dopo lo scaler.
+    """
+    if not audio_dir:
+        logger.warning("Nessuna cartella audio indicata: uso input casuali")
+        rng = np.random.default_rng(0)
+        return rng.standard_normal((n_samples, 128, 94, 1)).astype(np.float32), [None] * n_samples
+
+    paths = []
+    for root, _, files in os.walk(audio_dir):
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(AUDIO_EXTENSIONS))
+    paths = sorted(paths)[:n_samples]
+    if not paths:
+        raise ValueError(f"Nessun file audio trovato in {audio_dir}")
+
+    extractor = MelFeatureExtractor()
+    feature_scaler = FeatureScaler(joblib.load(SCALER_PATH))
+
+    clips = []
+    labels = []
+    for path in paths:
+        with open(path, "rb") as f:
+            clips.append(load_audio(f.read(), sr=extractor.sr, duration=3, offset=0.5))
+        label = os.path.basename(os.path.dirname(path)).lower()
+        labels.append(EMOTION_LABELS.index(label) if label in EMOTION_LABELS else None)
+
+    features = feature_scaler(extractor(clips))[..., np.newaxis]
+    logger.info(f"Caricati {len(clips)} file audio da {audio_dir}")
+    return features, labels
+
+
+def export_model(args):
+    import tensorflow as tf
+
+    if args.format == "onnx" and args.quantize == "float16":
+        raise ValueError("Quantizzazione float16 non supportata per ONNX")
+
+    output = args.output or default_artifact_path(args.format, MODEL_PATH, args.quantize)
+
+    model = tf.keras.models.load_model(MODEL_PATH)
+    start = time.perf_counter()
+
+    if args.format == "tflite":
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if args.quantize == "float16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif args.quantize == "int8":
+            # Quantizzazione intera completa dei pesi e delle attivazioni; ingresso e uscita restano float32
+            calibration, _ = load_dataset(args.calibration_dir, args.calibration_samples)
+
+            def representative_dataset():
+                for sample in calibration:
+                    yield [sample[np.newaxis]]
+
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        with open(output, "wb") as f:
+            f.write(converter.convert())
+
+    elif args.format == "onnx":
+        try:
+            import tf2onnx
+        except ImportError:
+            raise RuntimeError("Esportazione ONNX non disponibile: installare tf2onnx (pip install tf2onnx)")
+
+        input_shape = (None,) + tuple(model.input_shape[1:])
+        signature = [tf.TensorSpec(input_shape, tf.float32, name="features")]
+        float_output = output if args.quantize == "none" else output + ".float.onnx"
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=args.opset, output_path=float_output)
+        if args.quantize == "int8":
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(float_output, output, weight_type=QuantType.QInt8)
+            os.remove(float_output)
+
+    logger.info(f"Modello esportato in {output} ({os.path.getsize(output) / 1024:.0f} KiB) "
+                f"in {time.perf_counter() - start:.1f} s")
+
+
+def compare_backends(args):
+    features, labels = load_dataset(args.audio_dir, args.samples)
+    results = {}
+    reference = None
+
+    for name in args.backends.split(","):
+        name, _, path = name.partition("=")
+        path = path or default_artifact_path(name, MODEL_PATH)
+
+        start = time.perf_counter()
+        backend = load_backend(name, path)
+        backend.warmup(batch_sizes=sorted({1, args.batch_size}))
+        load_ms = (time.perf_counter() - start) * 1000
+
+        probs = np.concatenate([backend(features[i:i + args.batch_size])
+                                for i in range(0, len(features), args.batch_size)])
+        predicted = probs.argmax(axis=1)
+
+        single = []
+        for i in range(args.iterations):
+            sample = features[i % len(features)][np.newaxis]
+            start = time.perf_counter()
+            backend(sample)
+            single.append(time.perf_counter() - start)
+
+        batch = features[:args.batch_size]
+        batched = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            backend(batch)
+            batched.append(time.perf_counter() - start)
+
+        if reference is None:
+            reference = probs
+        labelled = [(p, l) for p, l in zip(predicted, labels) if l is not None]
+        results[f"{name}:{os.path.basename(path)}"] = {
+            "load_and_warmup_ms": load_ms,
+            "size_kib": os.path.getsize(path) / 1024,
+            "median_ms_batch_1": float(np.median(single) * 1000),
+            f"median_ms_batch_{len(batch)}": float(np.median(batched) * 1000),
+            "agreement_with_first": float(np.mean(predicted == reference.argmax(axis=1))),
+            "max_abs_prob_diff": float(np.max(np.abs(probs - reference))),
+            "accuracy": float(np.mean([p == l for p, l in labelled])) if labelled else None,
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esportazione e confronto dei backend di inferenza")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Esporta il modello Keras in TFLite o ONNX")
+    export.add_argument("--format", choices=["tflite", "onnx"], required=True)
+    export.add_argument("--quantize", choices=["none", "float16", "int8"], default="none")
+    export.add_argument("--output", help="Percorso dell'artefatto (predefinito: accanto a MODEL_PATH)")
+    export.add_argument("--calibration-dir", help="Cartella audio per la calibrazione int8 di TFLite")
+    export.add_argument("--calibration-samples", type=int, default=200)
+    export.add_argument("--opset", type=int, default=13)
+    export.set_defaults(func=export_model)
+
+    compare = subparsers.add_parser("compare", help="Confronta accuratezza e latenza dei backend")
+    compare.add_argument("--backends", default="keras,tflite,onnx",
+                         help="Elenco separato da virgole; il primo è il riferimento (es. keras,tflite=model/x.tflite)")
+    compare.add_argument("--audio-dir", help="Cartella audio, opzionalmente con sottocartelle per emozione")
+    compare.add_argument("--samples", type=int, default=200)
+    compare.add_argument("--batch-size", type=int, default=16)
+    compare.add_argument("--iterations", type=int, default=50)
+    compare.set_defaults(func=compare_backends)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
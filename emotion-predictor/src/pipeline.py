@@ -0,0 +1,119 @@
+"""Decodifica, features e forward pass eseguiti nell'executor.
+
+Modulo leggero, separato dall'app FastAPI: in modalità "process" i processi
+figli (avviati con spawn) importano solo questo modulo e caricano modello e
+scaler una volta sola con `init_worker`, senza ripetere warm-up, benchmark e
+verifiche eseguiti all'avvio del servizio. In modalità "thread" lo stato viene
+impostato dall'app con `configure` usando gli oggetti già caricati.
+
+Con spawn i figli rieseguono anche lo script principale: il servizio va avviato
+con `uvicorn app:app --app-dir src` (come nel Dockerfile), non con `python src/app.py`.
+"""
+import logging
+from typing import Optional
+
+import joblib
+import numpy as np
+
+from audio_io import load_audio
+from features import FeatureScaler, MelFeatureExtractor, librosa_mel_features
+from inference import load_backend
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+model = None
+scaler = None
+feature_scaler: Optional[FeatureScaler] = None
+mel_extractor: Optional[MelFeatureExtractor] = None
+
+
+def configure(model_obj, scaler_obj, feature_scaler_obj=None, mel_extractor_obj=None):
+    """Imposta lo stato del modulo con oggetti già caricati (processo principale)."""
+    global model, scaler, feature_scaler, mel_extractor
+    model = model_obj
+    scaler = scaler_obj
+    feature_scaler = feature_scaler_obj
+    mel_extractor = mel_extractor_obj
+
+
+def init_worker(
+    backend: str,
+    model_path: str,
+    scaler_path: str,
+    compiled: bool = True,
+    num_threads: Optional[int] = None,
+    fused_scaler: bool = True,
+    numpy_mel: bool = True,
+):
+    """Initializer dei processi del pool: carica modello e scaler nel processo figlio.
+
+    `fused_scaler` e `numpy_mel` riportano l'esito delle verifiche eseguite dal
+    processo principale, così i figli usano gli stessi percorsi senza ripeterle.
+    """
+    scaler_obj = joblib.load(scaler_path)
+    configure(
+        load_backend(backend, model_path, compiled=compiled, num_threads=num_threads),
+        scaler_obj,
+        FeatureScaler(scaler_obj) if fused_scaler else None,
+        MelFeatureExtractor() if numpy_mel else None,
+    )
+    logger.info(f"Processo di inferenza pronto (backend {backend})")
+
+
+def run_model(batch):
+    """Esegue un singolo forward pass su un batch di shape (N, 128, 94, 1)."""
+    return model(batch)
+
+
+def scale_features(features):
+    """Applica lo scaler a un batch di features di shape (N, 128, 94)."""
+    if feature_scaler is not None:
+        return feature_scaler(features)
+
+    # Percorso scikit-learn: appiattisci a (N, 12032) e ripristina la forma originale
+    return scaler.transform(features.reshape(len(features), -1)).reshape(features.shape)
+
+
+def compute_mel_batch(clips, sr=SAMPLE_RATE):
+    """Calcola le features mel di più clip in un'unica passata, shape (N, 128, 94)."""
+    if mel_extractor is not None:
+        return mel_extractor(clips)
+    return np.stack([librosa_mel_features(clip, sr=sr) for clip in clips]).astype(np.float32)
+
+
+def extract_mel_features(audio_data, sr=SAMPLE_RATE):
+    try:
+        logger.info(f"Estrazione delle features dall'audio caricato ({len(audio_data)} bytes)")
+        y = load_audio(audio_data, sr=sr, duration=3, offset=0.5)
+        logger.info(f"Audio caricato con shape: {y.shape}")
+
+        mel_spectrogram_db = compute_mel_batch([y], sr=sr)[0]
+        logger.info(f"Mel spectrogram shape dopo conversione in dB: {mel_spectrogram_db.shape}")
+
+        return mel_spectrogram_db
+
+    except Exception as e:
+        print(f"Errore durante l'estrazione delle features: {e}")
+        return None
+
+
+def prepare_features(audio_data):
+    """Decodifica, estrae e scala le features; restituisce un campione (128, 94, 1) o None."""
+    features = extract_mel_features(audio_data)
+    if features is None:
+        return None
+    # Applica lo scaler sul batch (qui di un solo elemento) e aggiungi la dimensione channel;
+    # la dimensione batch la aggiunge lo scheduler
+    return scale_features(features[np.newaxis])[0, ..., np.newaxis]
+
+
+def load_timeline_audio(audio_data, max_seconds):
+    """Decodifica l'intera registrazione, limitata a `max_seconds`."""
+    return load_audio(audio_data, sr=SAMPLE_RATE, duration=max_seconds)
+
+
+def prepare_window_batch(clips):
+    """Features scalate di un blocco di finestre, shape (N, 128, 94, 1)."""
+    return scale_features(compute_mel_batch(clips))[..., np.newaxis]
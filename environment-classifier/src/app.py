@@ -1,19 +1,39 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import time
 import logging
-import numpy as np
-import tensorflow as tf
+import threading
 import tensorflow_hub as hub
-import tensorflow_io as tfio
-import uuid
 from typing import Dict, List, Optional
 import uvicorn
 from pydantic import BaseModel
+from executor import ExecutorBusy, InferenceExecutor
+from scoring import AGGREGATION_MODES, EnvironmentIndex, load_class_names
+import model_store
+from buckets import BucketedYAMNet, parse_bucket_frames
+import pipeline
+
+# Istante di avvio del processo, per distinguerlo dal momento in cui il modello è pronto
+PROCESS_STARTED_AT = time.time()
 
 # Configurazione
 PORT = int(os.getenv("ENV_CLASSIFIER_PORT", 5005))
-MODEL_CACHE = "model_cache"
+EXECUTOR_KIND = os.getenv("EXECUTOR_KIND", "thread")  # thread, process
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 2))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", 16))
+TOP_K_CLASSES = int(os.getenv("TOP_K_CLASSES", 10))
+# Mappa delle classi YAMNet (predefinita: il CSV incluso negli asset del modello locale)
+YAMNET_CLASS_MAP = os.getenv("YAMNET_CLASS_MAP")
+# Bucket di lunghezza (in frame YAMNet da 0.48 s) con funzione a firma fissa; 64 frame ~ 31 s
+YAMNET_BUCKET_FRAMES = parse_bucket_frames(os.getenv("YAMNET_BUCKET_FRAMES", "2,4,8,16,32,64"))
+# Aggregazione dei frame YAMNet: mean, max o vote (sovrascrivibile per richiesta)
+AGGREGATION_MODE = os.getenv("AGGREGATION_MODE", "max")
+if AGGREGATION_MODE not in AGGREGATION_MODES:
+    raise ValueError(f"AGGREGATION_MODE non valido: {AGGREGATION_MODE}")
+# Sotto questa soglia RMS la clip è considerata silenzio e YAMNet non viene eseguito
+SILENCE_THRESHOLD_DBFS = float(os.getenv("SILENCE_THRESHOLD_DBFS", -60))
+MODEL_CACHE = model_store.MODEL_CACHE
 os.makedirs(MODEL_CACHE, exist_ok=True)
 
 # Configurazione logging
@@ -35,192 +55,158 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Contatori del pre-filtro energetico (aggiornati nel processo del servizio)
+gate_lock = threading.Lock()
+gate_stats = {"classified": 0, "silence_skipped": 0}
+
 
 # Modelli dati
-class ClassificationResponse(BaseModel):
+class TimelineSegment(BaseModel):
     environment: str
+    start: float
+    end: float
     confidence: float
-    all_detections: Optional[Dict[str, float]] = None
 
 
-# Caricare il modello YAMNet
+class ClassificationResponse(BaseModel):
+    environment: str
+    confidence: float
+    all_detections: Optional[Dict[str, float]] = None
+    aggregation: Optional[str] = None
+    timeline: Optional[List[TimelineSegment]] = None
+
+
+# Mappa delle classi ambientali alle emoji
+environment_to_emoji = {
+    "Speech": "🗣️",
+    "Inside, small room": "🏠",
+    "Inside, large room or hall": "🏢",
+    "Outside, urban or manmade": "🏙️",
+    "Outside, rural or natural": "🌳",
+    "Vehicle": "🚗",
+    "Music": "🎵",
+    "Silence": "🔇",
+    "Water": "💧",
+    "Wind": "💨",
+    "Animal": "🐾",
+    "Noise": "📢"
+}
+
+# Mapping delle classi YAMNet alle nostre classi semplificate
+yamnet_to_environment = {
+    'Speech': 'Speech',
+    'Inside, small room': 'Inside, small room',
+    'Inside, large room or hall': 'Inside, large room or hall',
+    'Vehicle': 'Vehicle',
+    'Car': 'Vehicle',
+    'Bus': 'Vehicle',
+    'Train': 'Vehicle',
+    'Subway, metro, underground': 'Vehicle',
+    'Traffic noise, roadway noise': 'Outside, urban or manmade',
+    'Water tap, faucet': 'Water',
+    'Sink (filling or washing)': 'Water',
+    'Rain': 'Water',
+    'Water': 'Water',
+    'Stream': 'Water',
+    'Wind': 'Wind',
+    'Wind noise (microphone)': 'Wind',
+    'Animal': 'Animal',
+    'Domestic animals, pets': 'Animal',
+    'Dog': 'Animal',
+    'Cat': 'Animal',
+    'Bird': 'Animal',
+    'Music': 'Music',
+    'Silence': 'Silence',
+    'Quiet': 'Silence'
+}
+
+
+# Caricare il modello YAMNet dall'archivio locale (download solo al primo avvio)
+model_timings: Dict[str, float] = {}
 try:
     logger.info("Caricamento del modello YAMNet...")
-    model = hub.load('https://tfhub.dev/google/yamnet/1')
-    logger.info("Modello YAMNet caricato con successo")
-
-    # Mappa delle classi ambientali alle emoji
-    environment_to_emoji = {
-        "Speech": "🗣️",
-        "Inside, small room": "🏠",
-        "Inside, large room or hall": "🏢",
-        "Outside, urban or manmade": "🏙️",
-        "Outside, rural or natural": "🌳",
-        "Vehicle": "🚗",
-        "Music": "🎵",
-        "Silence": "🔇",
-        "Water": "💧",
-        "Wind": "💨",
-        "Animal": "🐾",
-        "Noise": "📢"
-    }
-
-    # Mapping delle classi YAMNet alle nostre classi semplificate
-    yamnet_to_environment = {
-        'Speech': 'Speech',
-        'Inside, small room': 'Inside, small room',
-        'Inside, large room or hall': 'Inside, large room or hall',
-        'Vehicle': 'Vehicle',
-        'Car': 'Vehicle',
-        'Bus': 'Vehicle',
-        'Train': 'Vehicle',
-        'Subway, metro, underground': 'Vehicle',
-        'Traffic noise, roadway noise': 'Outside, urban or manmade',
-        'Water tap, faucet': 'Water',
-        'Sink (filling or washing)': 'Water',
-        'Rain': 'Water',
-        'Water': 'Water',
-        'Stream': 'Water',
-        'Wind': 'Wind',
-        'Wind noise (microphone)': 'Wind',
-        'Animal': 'Animal',
-        'Domestic animals, pets': 'Animal',
-        'Dog': 'Animal',
-        'Cat': 'Animal',
-        'Bird': 'Animal',
-        'Music': 'Music',
-        'Silence': 'Silence',
-        'Quiet': 'Silence'
-    }
+    start = time.perf_counter()
+    model_dir = model_store.resolve_model_dir()
+    model = hub.load(model_dir)
+    model_timings["load_seconds"] = time.perf_counter() - start
+    logger.info(f"Modello YAMNet caricato con successo da {model_dir}")
+
+    # Una funzione a forma fissa per bucket, riscaldata subito: la prima richiesta non paga il tracing
+    start = time.perf_counter()
+    yamnet = BucketedYAMNet(model, YAMNET_BUCKET_FRAMES)
+    yamnet.warmup()
+    model_timings["warmup_seconds"] = time.perf_counter() - start
+    logger.info(f"Warm-up completato in {model_timings['warmup_seconds']:.2f} s")
 
 except Exception as e:
     logger.error(f"Errore nel caricamento del modello YAMNet: {e}")
     model = None
+    yamnet = None
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    cpu_executor.shutdown()
 
 
 @app.get("/health")
 async def health_check():
     if model is None:
         raise HTTPException(status_code=500, detail="Modello YAMNet non caricato correttamente")
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "process_started_at": PROCESS_STARTED_AT,
+        "model_ready_at": MODEL_READY_AT,
+        "startup_seconds": MODEL_READY_AT - PROCESS_STARTED_AT,
+        **model_timings
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Restituisce lo stato dell'executor di classificazione e l'uso dei bucket YAMNet."""
+    with gate_lock:
+        gate = dict(gate_stats)
+    total = gate["classified"] + gate["silence_skipped"]
+    gate["skip_ratio"] = gate["silence_skipped"] / total if total else 0.0
+    gate["threshold_dbfs"] = SILENCE_THRESHOLD_DBFS
+    return {
+        "executor": cpu_executor.stats(),
+        "buckets": yamnet.stats() if yamnet is not None else None,
+        "energy_gate": gate,
+    }
 
 
 @app.post("/classify", response_model=ClassificationResponse)
-async def classify_environment(file: UploadFile = File(...)):
+async def classify_environment(
+    file: UploadFile = File(...),
+    aggregation: Optional[str] = Query(None, description="mean, max o vote"),
+):
     if model is None:
         raise HTTPException(status_code=500, detail="Modello YAMNet non disponibile")
 
+    aggregation = aggregation or AGGREGATION_MODE
+    if aggregation not in AGGREGATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Aggregazione non supportata: {aggregation}")
+
     try:
-        # Leggi il file audio
+        # Leggi il file audio ed esegui la classificazione fuori dall'event loop
         contents = await file.read()
-        temp_path = f"/tmp/{uuid.uuid4()}.wav"
-        with open(temp_path, "wb") as f:
-            f.write(contents)
-
-        # Carica e preelabora l'audio per YAMNet
-        waveform, sample_rate = load_wav_16k_mono(temp_path)
-
-        # Pulisci il file temporaneo
-        os.remove(temp_path)
-
-        # Esegui la classificazione
-        scores, embeddings, spectrogram = model(waveform)
-        scores_np = scores.numpy()
-
-        # Ottieni le classi e le probabilità
-        class_map = yamnet_model_metadata()
-        top_indices = np.argsort(scores_np[0])[::-1][:10]  # Top 10 classi
-
-        # Mappa le classi YAMNet alle nostre classi ambientali
-        environment_scores = {}
-        for i in top_indices:
-            yamnet_class = class_map[i]
-            environment = map_to_environment(yamnet_class)
-            if environment and environment not in environment_scores:
-                environment_scores[environment] = float(scores_np[0][i])
-            elif environment in environment_scores:
-                environment_scores[environment] = max(environment_scores[environment], float(scores_np[0][i]))
-
-        # Se non è stato trovato nessun ambiente, usa "Outside, urban or manmade" come default
-        if not environment_scores:
-            environment_scores["Outside, urban or manmade"] = 0.5
-
-        # Trova l'ambiente con la probabilità più alta
-        top_environment = max(environment_scores.items(), key=lambda x: x[1])
-
-        return {
-            "environment": top_environment[0],
-            "confidence": top_environment[1],
-            "all_detections": environment_scores
-        }
+        result = await cpu_executor.run(pipeline.classify_audio, contents, aggregation)
+
+        # Metriche aggiornate qui: in modalità "process" il figlio non le condivide
+        yamnet.record(result.pop("bucket_calls"))
+        with gate_lock:
+            gate_stats["silence_skipped" if result.pop("silence_skipped") else "classified"] += 1
+        return result
 
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=f"Servizio occupato, riprovare più tardi: {str(e)}")
     except Exception as e:
         logger.error(f"Errore durante la classificazione dell'ambiente: {e}")
         raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
 
 
-def load_wav_16k_mono(file_path):
-    """Carica un file audio e lo converte a 16 kHz mono per YAMNet."""
-    try:
-        # Prima prova il decoder WAV standard
-        file_contents = tf.io.read_file(file_path)
-        try:
-            wav, sample_rate = tf.audio.decode_wav(
-                file_contents,
-                desired_channels=1
-            )
-        except tf.errors.InvalidArgumentError:
-            # Se il file non è WAV, usa ffmpeg per convertirlo
-            import subprocess
-            output_path = f"{file_path}_converted.wav"
-            subprocess.run([
-                "ffmpeg", "-y", "-i", file_path,
-                "-ar", "16000", "-ac", "1", "-f", "wav",
-                output_path
-            ], check=True, capture_output=True)
-
-            # Ora leggi il file convertito
-            file_contents = tf.io.read_file(output_path)
-            wav, sample_rate = tf.audio.decode_wav(
-                file_contents,
-                desired_channels=1
-            )
-            # Pulizia file temporaneo
-            os.remove(output_path)
-
-        wav = tf.squeeze(wav, axis=-1)
-        sample_rate = tf.cast(sample_rate, dtype=tf.int64)
-
-        # Resample a 16 kHz se necessario
-        if sample_rate != 16000:
-            target_rate = 16000
-            wav = tfio.audio.resample(wav, sample_rate, target_rate)
-
-        return wav, sample_rate
-    except Exception as e:
-        logger.error(f"Errore nel caricamento dell'audio: {e}")
-        raise e
-
-
-def yamnet_model_metadata():
-    """Restituisce le etichette delle classi YAMNet."""
-    # URL aggiornato o file locale (se disponibile)
-    try:
-        class_map_path = tf.keras.utils.get_file(
-            'yamnet_class_map.csv',
-            'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
-        )
-        class_names = []
-        with open(class_map_path) as csv_file:
-            for row in csv_file:
-                class_names.append(row.strip().split(',')[2])
-        return class_names
-    except:
-        logger.warning("Impossibile scaricare la mappa delle classi. Utilizzando mappa interna.")
-        # Versione cache delle classi più importanti se il download fallisce
-        return list(yamnet_to_environment.keys())
-
-
 def map_to_environment(yamnet_class):
     """Mappa una classe YAMNet a una delle nostre classi ambientali."""
     if yamnet_class in yamnet_to_environment:
@@ -237,6 +223,50 @@ def map_to_environment(yamnet_class):
     return None
 
 
+# Mappa delle classi e indice classe -> ambiente, costruiti una sola volta all'avvio
+environment_index = None
+if model is not None:
+    try:
+        class_map_path = (
+            YAMNET_CLASS_MAP
+            or model_store.class_map_path(model_dir)
+            or model.class_map_path().numpy().decode("utf-8")
+        )
+        environment_index = EnvironmentIndex(
+            load_class_names(class_map_path),
+            list(environment_to_emoji.keys()),
+            map_to_environment
+        )
+    except Exception as e:
+        logger.error(f"Errore nel caricamento della mappa delle classi YAMNet: {e}")
+        model = None
+
+# Stato della pipeline nel processo principale (modalità "thread")
+pipeline.configure(yamnet, environment_index, TOP_K_CLASSES, SILENCE_THRESHOLD_DBFS)
+
+# Executor per decodifica e inferenza YAMNet: l'event loop resta libero.
+# In modalità "process" ogni figlio carica YAMNet una volta sola nell'initializer
+cpu_executor = InferenceExecutor(
+    EXECUTOR_KIND,
+    EXECUTOR_WORKERS,
+    EXECUTOR_QUEUE_SIZE,
+    name="environment",
+    initializer=pipeline.init_worker if EXECUTOR_KIND == "process" and model is not None else None,
+    initargs=(
+        model_dir if model is not None else None,
+        YAMNET_BUCKET_FRAMES,
+        environment_index,
+        TOP_K_CLASSES,
+        SILENCE_THRESHOLD_DBFS,
+    ),
+)
+
+# Il servizio è pronto solo dopo caricamento, warm-up e costruzione dell'indice
+MODEL_READY_AT = time.time()
+if model is not None:
+    logger.info(f"Modello pronto {MODEL_READY_AT - PROCESS_STARTED_AT:.2f} s dopo l'avvio del processo")
+
+
 @app.get("/environments")
 async def get_environments():
     """Restituisce l'elenco delle classi ambientali e le rispettive emoji."""
@@ -247,4 +277,5 @@ async def get_environments():
 
 if __name__ == "__main__":
     print(f"Avvio del servizio Environment Classifier sulla porta {PORT}")
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True)
\ No newline at end of file
+    # Senza reload: in produzione il servizio si avvia con `uvicorn app:app --app-dir src` (vedi Dockerfile)
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""Decodifica in memoria e ricampionamento a 16 kHz mono per YAMNet.
+
+I WAV PCM vengono letti direttamente dai bytes; gli altri container (WebM,
+MP3, OGG...) passano attraverso un unico processo ffmpeg via stdin/stdout,
+senza file temporanei. Benchmark dei tre percorsi:
+
+    python src/audio_decode.py benchmark --seconds 5 --iterations 20
+"""
+import argparse
+import functools
+import io
+import json
+import logging
+import subprocess
+import time
+import wave
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TARGET_RATE = 16000
+# Campioni di output calcolati per blocco: limita la memoria del ricampionamento
+RESAMPLE_BLOCK = 8192
+
+
+def decode_to_16k_mono(data: bytes) -> np.ndarray:
+    """Decodifica i bytes caricati in una forma d'onda float32 a 16 kHz mono."""
+    try:
+        samples, sample_rate = decode_wav(data)
+    except (wave.Error, EOFError, ValueError):
+        return decode_with_ffmpeg(data)
+    return resample(samples, sample_rate, TARGET_RATE)
+
+
+def decode_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """Legge un WAV PCM intero (8/16/24/32 bit) dai bytes; restituisce (mono float32, sample rate)."""
+    with wave.open(io.BytesIO(data)) as wav_file:
+        channels = wav_file.getnchannels()
+        width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        raw = wav_file.readframes(wav_file.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Larghezza del campione non supportata: {width} byte")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def decode_with_ffmpeg(data: bytes) -> np.ndarray:
+    """Converte qualsiasi container supportato da ffmpeg in float32 16 kHz mono tramite pipe."""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(TARGET_RATE),
+            "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+        check=True,
+    )
+    samples = np.frombuffer(result.stdout, dtype=np.float32)
+    if samples.size == 0:
+        raise ValueError("ffmpeg non ha prodotto campioni audio")
+    return samples
+
+
+def rms_dbfs(waveform: np.ndarray) -> float:
+    """Livello RMS della forma d'onda in dBFS (-inf per il silenzio digitale)."""
+    if waveform.size == 0:
+        return float("-inf")
+    rms = float(np.sqrt(np.mean(np.square(waveform, dtype=np.float64))))
+    return 20.0 * np.log10(rms) if rms > 0 else float("-inf")
+
+
+@functools.lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int, half_len: int = 10, beta: float = 5.0) -> Tuple[np.ndarray, int]:
+    """Filtro passa-basso (sinc con finestra di Kaiser) scomposto in `up` fasi.
+
+    Stesso progetto di `scipy.signal.resample_poly`; il risultato viene
+    calcolato una sola volta per ogni coppia (up, down).
+    """
+    max_rate = max(up, down)
+    cutoff = 1.0 / max_rate
+    n_taps = 2 * half_len * max_rate + 1
+    t = np.arange(n_taps) - (n_taps - 1) / 2
+    h = cutoff * np.sinc(cutoff * t) * np.kaiser(n_taps, beta)
+    h = h / h.sum() * up
+
+    taps_per_phase = -(-n_taps // up)
+    h = np.pad(h, (0, taps_per_phase * up - n_taps))
+    # bank[p, i] = h[p + i * up]
+    bank = np.ascontiguousarray(h.reshape(taps_per_phase, up).T, dtype=np.float32)
+    return bank, (n_taps - 1) // 2
+
+
+def resample(samples: np.ndarray, orig_rate: int, target_rate: int = TARGET_RATE) -> np.ndarray:
+    """Ricampionamento polifase con filtro in cache; calcola solo i campioni di output."""
+    samples = np.asarray(samples, dtype=np.float32)
+    if orig_rate == target_rate:
+        return samples
+
+    g = gcd(orig_rate, target_rate)
+    up, down = target_rate // g, orig_rate // g
+    bank, delay = _polyphase_filter(up, down)
+    taps = bank.shape[1]
+
+    n_out = -(-len(samples) * up // down)
+    padded = np.concatenate([np.zeros(taps, np.float32), samples, np.zeros(2 * taps, np.float32)])
+    offsets = taps - np.arange(taps)
+
+    output = np.empty(n_out, dtype=np.float32)
+    for start in range(0, n_out, RESAMPLE_BLOCK):
+        # Posizione di ogni campione di output nel segnale sovracampionato (ritardo del filtro compensato)
+        t = np.arange(start, min(start + RESAMPLE_BLOCK, n_out)) * down + delay
+        indices = (t // up)[:, np.newaxis] + offsets
+        output[start:start + len(t)] = np.einsum("ij,ij->i", padded[indices], bank[t % up])
+    return output
+
+
+def _encode_test_signal(fmt: str, seconds: float, rate: int = 44100) -> bytes:
+    """Genera un segnale di prova stereo e lo codifica nel formato richiesto."""
+    t = np.arange(int(seconds * rate)) / rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(t.size)
+    pcm = (np.stack([tone, tone], axis=1) * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(pcm.tobytes())
+    if fmt == "wav":
+        return buffer.getvalue()
+
+    codec = {"webm": ["-c:a", "libopus", "-f", "webm"], "mp3": ["-c:a", "libmp3lame", "-f", "mp3"]}[fmt]
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *codec, "pipe:1"],
+        input=buffer.getvalue(),
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def benchmark(seconds: float, iterations: int):
+    results = {}
+    for fmt in ("wav", "webm", "mp3"):
+        data = _encode_test_signal(fmt, seconds)
+        decode_to_16k_mono(data)  # Riscalda la cache del filtro
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            waveform = decode_to_16k_mono(data)
+            timings.append(time.perf_counter() - start)
+
+        median = float(np.median(timings))
+        results[fmt] = {
+            "input_kib": len(data) / 1024,
+            "output_seconds": len(waveform) / TARGET_RATE,
+            "median_ms": median * 1000,
+            "realtime_factor": seconds / median if median else None,
+        }
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Decodifica audio per l'environment-classifier")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("benchmark", help="Misura i percorsi WAV, WebM e MP3")
+    bench.add_argument("--seconds", type=float, default=5.0)
+    bench.add_argument("--iterations", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        benchmark(args.seconds, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
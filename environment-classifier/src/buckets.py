@@ -0,0 +1,143 @@
+"""Chiamate YAMNet a forma fissa tramite bucket di lunghezza.
+
+YAMNet produce un frame di punteggi ogni 0.48 s (7680 campioni a 16 kHz) con
+finestre da 0.96 s; una forma d'onda di `n` campioni viene estesa internamente a
+15600 + 7680 * (frames - 1) campioni. Portando ogni richiesta alla lunghezza del
+bucket più vicino, ogni bucket usa una `tf.function` con firma fissa, tracciata e
+riscaldata all'avvio; i frame di solo padding vengono scartati prima
+dell'aggregazione dei punteggi.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Lunghezza minima della finestra YAMNet e passo tra frame consecutivi, in campioni
+WINDOW_SAMPLES = 15600
+HOP_SAMPLES = 7680
+
+
+def bucket_length(frames: int) -> int:
+    """Numero di campioni che produce esattamente `frames` frame YAMNet."""
+    return WINDOW_SAMPLES + HOP_SAMPLES * (frames - 1)
+
+
+def frames_for(num_samples: int) -> int:
+    """Numero di frame YAMNet prodotti da una forma d'onda di `num_samples` campioni."""
+    return 1 + -(-max(0, num_samples - WINDOW_SAMPLES) // HOP_SAMPLES)
+
+
+class BucketedYAMNet:
+    """Esegue YAMNet su forme d'onda portate alla lunghezza di un bucket.
+
+    Restituisce solo i punteggi dei frame validi, shape (frames, 521). Le clip
+    più lunghe del bucket massimo vengono elaborate a blocchi allineati ai frame.
+    `run` non aggiorna le metriche e restituisce i bucket usati, che `record`
+    può registrare in un altro processo.
+    """
+
+    def __init__(self, model, bucket_frames: Iterable[int]):
+        import tensorflow as tf
+
+        self.model = model
+        self.bucket_frames = sorted(set(int(f) for f in bucket_frames if int(f) > 0))
+        if not self.bucket_frames:
+            raise ValueError("Nessun bucket YAMNet valido configurato")
+        self.lengths = [bucket_length(f) for f in self.bucket_frames]
+
+        start = time.perf_counter()
+        self._fns = {length: self._compile(tf, length) for length in self.lengths}
+        self.trace_seconds = time.perf_counter() - start
+        self.warmup_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._calls: Dict[int, int] = {frames: 0 for frames in self.bucket_frames}
+        self._padding_frames = 0
+        self._valid_frames = 0
+        self._chunked_clips = 0
+
+    def _compile(self, tf, length: int):
+        fn = tf.function(
+            lambda waveform: self.model(waveform)[0],
+            input_signature=[tf.TensorSpec([length], tf.float32)],
+        )
+        fn.get_concrete_function()
+        return fn
+
+    def warmup(self):
+        """Esegue ogni bucket una volta su silenzio per inizializzare kernel e allocatori."""
+        start = time.perf_counter()
+        for length in self.lengths:
+            self._fns[length](np.zeros(length, dtype=np.float32))
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"Warm-up di {len(self.lengths)} bucket YAMNet completato in {self.warmup_seconds:.2f} s")
+
+    def _run_bucket(self, waveform: np.ndarray, valid_frames: int) -> Tuple[np.ndarray, Tuple[int, int]]:
+        index = bisect.bisect_left(self.lengths, len(waveform))
+        length = self.lengths[index]
+        padded = np.zeros(length, dtype=np.float32)
+        padded[:len(waveform)] = waveform
+
+        scores = self._fns[length](padded).numpy()
+        return scores[:valid_frames], (self.bucket_frames[index], valid_frames)
+
+    def run(self, waveform: np.ndarray) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """Punteggi dei frame validi e bucket usati, come coppie (frame del bucket, frame validi)."""
+        waveform = np.asarray(waveform, dtype=np.float32)
+        total_frames = frames_for(len(waveform))
+        max_frames = self.bucket_frames[-1]
+        if total_frames <= max_frames:
+            scores, call = self._run_bucket(waveform, total_frames)
+            return scores, [call]
+
+        # Blocchi da `max_frames` frame: ogni blocco riparte esattamente dal frame successivo
+        chunks: List[np.ndarray] = []
+        calls: List[Tuple[int, int]] = []
+        for first_frame in range(0, total_frames, max_frames):
+            start = first_frame * HOP_SAMPLES
+            chunk = waveform[start:start + self.lengths[-1]]
+            scores, call = self._run_bucket(chunk, min(max_frames, total_frames - first_frame))
+            chunks.append(scores)
+            calls.append(call)
+        return np.concatenate(chunks), calls
+
+    def record(self, calls: List[Tuple[int, int]]):
+        """Aggiorna le metriche con i bucket usati da una clip."""
+        with self._lock:
+            for bucket_frames, valid_frames in calls:
+                self._calls[bucket_frames] += 1
+                self._padding_frames += bucket_frames - valid_frames
+                self._valid_frames += valid_frames
+            if len(calls) > 1:
+                self._chunked_clips += 1
+
+    def __call__(self, waveform: np.ndarray) -> np.ndarray:
+        scores, calls = self.run(waveform)
+        self.record(calls)
+        return scores
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            total = self._valid_frames + self._padding_frames
+            stats = {
+                "buckets_frames": self.bucket_frames,
+                "calls_per_bucket": dict(self._calls),
+                "valid_frames": self._valid_frames,
+                "padding_frames": self._padding_frames,
+                "padding_ratio": self._padding_frames / total if total else 0.0,
+                "chunked_clips": self._chunked_clips,
+                "trace_ms": self.trace_seconds * 1000,
+                "warmup_ms": self.warmup_seconds * 1000,
+            }
+        return stats
+
+
+def parse_bucket_frames(value: Optional[str]) -> List[int]:
+    """Legge l'elenco dei bucket (in frame) da una stringa separata da virgole."""
+    return [int(part) for part in (value or "").split(",") if part.strip()]
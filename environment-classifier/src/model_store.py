@@ -0,0 +1,84 @@
+"""Archivio locale del modello YAMNet per l'environment-classifier.
+
+Il modello viene cercato come SavedModel in `YAMNET_MODEL_DIR`; se manca (e il
+download è consentito) viene scaricato da TF Hub una sola volta e copiato
+nell'archivio. Per popolare l'archivio in anticipo, ad esempio in fase di build:
+
+    python src/model_store.py prefetch
+"""
+import argparse
+import logging
+import os
+import shutil
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE = os.getenv("MODEL_CACHE", "model_cache")
+YAMNET_HANDLE = os.getenv("YAMNET_HANDLE", "https://tfhub.dev/google/yamnet/1")
+YAMNET_MODEL_DIR = os.getenv("YAMNET_MODEL_DIR", os.path.join(MODEL_CACHE, "yamnet"))
+YAMNET_ALLOW_DOWNLOAD = os.getenv("YAMNET_ALLOW_DOWNLOAD", "true").lower() == "true"
+CLASS_MAP_ASSET = os.path.join("assets", "yamnet_class_map.csv")
+
+
+def is_saved_model(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "saved_model.pb"))
+
+
+def prefetch(handle: str = YAMNET_HANDLE, target: str = YAMNET_MODEL_DIR) -> str:
+    """Scarica il modello da TF Hub (con cache in MODEL_CACHE) e lo copia in `target`."""
+    os.environ.setdefault("TFHUB_CACHE_DIR", os.path.join(MODEL_CACHE, "tfhub"))
+    import tensorflow_hub as hub
+
+    logger.info(f"Download del modello YAMNet da {handle}...")
+    source = hub.resolve(handle)
+
+    # Copia atomica: un archivio a metà non viene mai scambiato per un modello valido
+    staging = f"{target}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(source, staging)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    logger.info(f"Modello YAMNet salvato in {target}")
+    return target
+
+
+def resolve_model_dir(model_dir: str = YAMNET_MODEL_DIR, allow_download: bool = YAMNET_ALLOW_DOWNLOAD) -> str:
+    """Restituisce la directory locale del SavedModel, scaricandolo solo se necessario e consentito."""
+    if is_saved_model(model_dir):
+        return model_dir
+    if not allow_download:
+        raise FileNotFoundError(f"Modello YAMNet non trovato in {model_dir} e download disabilitato")
+    return prefetch(target=model_dir)
+
+
+def class_map_path(model_dir: str) -> Optional[str]:
+    """Percorso della mappa delle classi inclusa nel SavedModel, se presente."""
+    path = os.path.join(model_dir, CLASS_MAP_ASSET)
+    return path if os.path.isfile(path) else None
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Gestione dell'archivio locale del modello YAMNet")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch = subparsers.add_parser("prefetch", help="Scarica YAMNet nell'archivio locale")
+    fetch.add_argument("--handle", default=YAMNET_HANDLE)
+    fetch.add_argument("--target", default=YAMNET_MODEL_DIR)
+    fetch.add_argument("--force", action="store_true", help="Scarica anche se il modello è già presente")
+
+    args = parser.parse_args()
+    if args.command == "prefetch":
+        if is_saved_model(args.target) and not args.force:
+            logger.info(f"Modello YAMNet già presente in {args.target}")
+        else:
+            prefetch(args.handle, args.target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Decodifica, YAMNet e punteggi per ambiente eseguiti nell'executor.
+
+Modulo leggero, separato dall'app FastAPI: in modalità "process" i processi
+figli (avviati con spawn) importano solo questo modulo e caricano YAMNet una
+volta sola con `init_worker`; l'indice degli ambienti, già costruito dal
+processo principale, arriva serializzato. In modalità "thread" lo stato viene
+impostato dall'app con `configure` usando gli oggetti già caricati.
+
+Con spawn i figli rieseguono anche lo script principale: il servizio va avviato
+con `uvicorn app:app --app-dir src` (come nel Dockerfile), non con `python src/app.py`.
+"""
+import logging
+import time
+from typing import List, Optional
+
+from audio_decode import decode_to_16k_mono, rms_dbfs
+from buckets import BucketedYAMNet
+from scoring import EnvironmentIndex, aggregate, timeline
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+yamnet: Optional[BucketedYAMNet] = None
+environment_index: Optional[EnvironmentIndex] = None
+top_k_classes = 10
+silence_threshold_dbfs = -60.0
+
+
+def configure(yamnet_obj, index_obj, top_k, silence_threshold):
+    """Imposta lo stato del modulo con oggetti già caricati (processo principale)."""
+    global yamnet, environment_index, top_k_classes, silence_threshold_dbfs
+    yamnet = yamnet_obj
+    environment_index = index_obj
+    top_k_classes = top_k
+    silence_threshold_dbfs = silence_threshold
+
+
+def init_worker(
+    model_dir: str,
+    bucket_frames: List[int],
+    index: EnvironmentIndex,
+    top_k: int,
+    silence_threshold: float,
+):
+    """Initializer dei processi del pool: carica e riscalda YAMNet nel processo figlio."""
+    import tensorflow_hub as hub
+
+    start = time.perf_counter()
+    bucketed = BucketedYAMNet(hub.load(model_dir), bucket_frames)
+    bucketed.warmup()
+    configure(bucketed, index, top_k, silence_threshold)
+    logger.info(f"Processo di classificazione pronto in {time.perf_counter() - start:.2f} s")
+
+
+def classify_audio(contents, aggregation):
+    """Classifica l'ambiente acustico dei bytes audio caricati, frame per frame.
+
+    `bucket_calls` riporta i bucket YAMNet usati: le metriche vengono aggiornate
+    dal processo del servizio, anche quando la classificazione gira in un figlio.
+    """
+    # Decodifica in memoria: WAV letto direttamente, altri formati via pipe ffmpeg
+    waveform = decode_to_16k_mono(contents)
+    duration = len(waveform) / SAMPLE_RATE
+
+    # Pre-filtro energetico: le clip silenziose non passano da YAMNet
+    if rms_dbfs(waveform) < silence_threshold_dbfs:
+        return {
+            "environment": "Silence",
+            "confidence": 1.0,
+            "all_detections": {"Silence": 1.0},
+            "aggregation": aggregation,
+            "timeline": [{"environment": "Silence", "start": 0.0, "end": round(duration, 2), "confidence": 1.0}],
+            "silence_skipped": True,
+            "bucket_calls": []
+        }
+
+    # Esegui la classificazione nel bucket di lunghezza adatto; i frame di padding sono già esclusi
+    scores_np, bucket_calls = yamnet.run(waveform)
+
+    # Punteggi per ambiente: una riduzione vettorizzata su tutte le classi e tutti i frame
+    frame_scores = environment_index.frame_scores(scores_np, top_k=top_k_classes)
+    environment_scores = environment_index.to_dict(aggregate(frame_scores, aggregation))
+
+    # Se non è stato trovato nessun ambiente, usa "Outside, urban or manmade" come default
+    if not environment_scores:
+        environment_scores["Outside, urban or manmade"] = 0.5
+
+    # Trova l'ambiente con la probabilità più alta
+    top_environment = max(environment_scores.items(), key=lambda x: x[1])
+
+    return {
+        "environment": top_environment[0],
+        "confidence": top_environment[1],
+        "all_detections": environment_scores,
+        "aggregation": aggregation,
+        "timeline": timeline(frame_scores, environment_index.environments),
+        "silence_skipped": False,
+        "bucket_calls": bucket_calls
+    }
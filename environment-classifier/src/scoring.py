@@ -0,0 +1,119 @@
+import csv
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def load_class_names(class_map_path: str) -> List[str]:
+    """Legge i nomi delle classi YAMNet dal CSV (index, mid, display_name)."""
+    with open(class_map_path, newline="") as csv_file:
+        return [row["display_name"] for row in csv.DictReader(csv_file)]
+
+
+class EnvironmentIndex:
+    """Indice precomputato che raggruppa le 521 classi YAMNet per ambiente.
+
+    Le classi mappate vengono ordinate per ambiente: il punteggio di ogni
+    ambiente in ogni frame è il massimo dei punteggi delle sue classi, calcolato
+    con una sola `np.maximum.reduceat` su tutti i frame.
+    """
+
+    def __init__(
+        self,
+        class_names: List[str],
+        environments: List[str],
+        map_fn: Callable[[str], Optional[str]],
+    ):
+        self.environments = list(environments)
+        env_ids = np.full(len(class_names), -1, dtype=np.int64)
+        for i, name in enumerate(class_names):
+            environment = map_fn(name)
+            if environment in self.environments:
+                env_ids[i] = self.environments.index(environment)
+        self.class_to_environment = env_ids
+
+        mapped = np.flatnonzero(env_ids >= 0)
+        self._order = mapped[np.argsort(env_ids[mapped], kind="stable")]
+        sorted_envs = env_ids[self._order]
+        self._boundaries = np.flatnonzero(np.r_[True, sorted_envs[1:] != sorted_envs[:-1]])
+        self._group_envs = sorted_envs[self._boundaries]
+        logger.info(f"Indice ambienti: {len(mapped)} classi YAMNet mappate su {len(self._group_envs)} ambienti")
+
+    def frame_scores(self, scores: np.ndarray, top_k: Optional[int] = 10) -> np.ndarray:
+        """Punteggi per ambiente e per frame, shape (frames, n_ambienti).
+
+        Con `top_k` vengono considerate, frame per frame, solo le `top_k` classi
+        più probabili; gli ambienti senza classi rilevate valgono 0.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if top_k is not None and top_k < scores.shape[1]:
+            kth = np.partition(scores, -top_k, axis=1)[:, -top_k, np.newaxis]
+            scores = np.where(scores >= kth, scores, 0.0)
+
+        result = np.zeros((scores.shape[0], len(self.environments)), dtype=np.float32)
+        if len(self._order):
+            result[:, self._group_envs] = np.maximum.reduceat(scores[:, self._order], self._boundaries, axis=1)
+        return result
+
+    def to_dict(self, environment_scores: np.ndarray) -> Dict[str, float]:
+        """Converte un vettore di punteggi per ambiente nel dizionario delle rilevazioni (> 0)."""
+        return {
+            self.environments[i]: float(score)
+            for i, score in enumerate(environment_scores)
+            if score > 0
+        }
+
+
+AGGREGATION_MODES = ("mean", "max", "vote")
+
+
+def aggregate(frame_scores: np.ndarray, mode: str = "max") -> np.ndarray:
+    """Riduce i punteggi (frames, n_ambienti) a un vettore per ambiente.
+
+    - `mean`: media dei punteggi su tutti i frame
+    - `max`: punteggio massimo su tutti i frame
+    - `vote`: frazione dei frame in cui l'ambiente è il più probabile
+    """
+    if mode == "mean":
+        return frame_scores.mean(axis=0)
+    if mode == "max":
+        return frame_scores.max(axis=0)
+    if mode == "vote":
+        active = frame_scores.max(axis=1) > 0
+        votes = np.bincount(frame_scores[active].argmax(axis=1), minlength=frame_scores.shape[1])
+        return (votes / len(frame_scores)).astype(np.float32)
+    raise ValueError(f"Modalità di aggregazione non supportata: {mode}")
+
+
+def timeline(
+    frame_scores: np.ndarray,
+    environments: List[str],
+    hop_seconds: float = 0.48,
+    window_seconds: float = 0.96,
+) -> List[Dict[str, object]]:
+    """Segmenti consecutivi con lo stesso ambiente dominante frame per frame.
+
+    I frame senza alcun ambiente rilevato interrompono i segmenti e non compaiono.
+    """
+    if len(frame_scores) == 0:
+        return []
+    winners = np.where(frame_scores.max(axis=1) > 0, frame_scores.argmax(axis=1), -1)
+    # Inizio di ogni sequenza di frame con lo stesso vincitore
+    starts = np.flatnonzero(np.r_[True, winners[1:] != winners[:-1]])
+    ends = np.r_[starts[1:], len(winners)]
+
+    segments = []
+    for start, end in zip(starts, ends):
+        env = winners[start]
+        if env < 0:
+            continue
+        segments.append({
+            "environment": environments[env],
+            "start": round(float(start * hop_seconds), 2),
+            "end": round(float((end - 1) * hop_seconds + window_seconds), 2),
+            "confidence": float(frame_scores[start:end, env].mean()),
+        })
+    return segments
@@ -2,7 +2,8 @@
 from fastapi import FastAPI, Request, Form, HTTPException, UploadFile, File
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import os
 import uvicorn
@@ -199,39 +200,74 @@ async def get_chat_response(message: str = Form(...), emotion: str = Form(...),
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Header inoltrati tra browser e tts-service per negoziazione del formato e richieste Range
+AUDIO_REQUEST_HEADERS = ("accept", "range", "if-range")
+AUDIO_RESPONSE_HEADERS = ("content-length", "content-range", "accept-ranges", "vary", "etag", "last-modified")
+
+
 @app.get("/api/tts/audio/{audio_id}")
-async def proxy_audio(audio_id: str):
+async def proxy_audio(audio_id: str, request: Request):
+    """Inoltra l'audio in streaming, senza caricarlo in memoria, con formato e Range della richiesta originale."""
+    client = httpx.AsyncClient(timeout=600.0)
     try:
-        logger.info(f"Proxy richiesta audio per id: {audio_id}")
         target_url = f"{API_GATEWAY_URL}/api/tts/audio/{audio_id}"
-        logger.info(f"URL target: {target_url}")
+        logger.info(f"Proxy richiesta audio per id: {audio_id} ({request.headers.get('range', 'intero')})")
+
+        headers = {name: request.headers[name] for name in AUDIO_REQUEST_HEADERS if name in request.headers}
+        upstream = await client.send(
+            client.build_request("GET", target_url, params=dict(request.query_params), headers=headers),
+            stream=True
+        )
+
+        content_type = upstream.headers.get('content-type', '')
+        if upstream.status_code in (200, 206) and content_type.startswith('audio/'):
+            # Restituisci il file audio (o l'intervallo richiesto) man mano che arriva
+            async def close_upstream():
+                await upstream.aclose()
+                await client.aclose()
+
+            return StreamingResponse(
+                upstream.aiter_raw(),
+                status_code=upstream.status_code,
+                media_type=content_type,
+                headers={name: upstream.headers[name] for name in AUDIO_RESPONSE_HEADERS if name in upstream.headers},
+                background=BackgroundTask(close_upstream)
+            )
 
-        async with httpx.AsyncClient(timeout=600.0) as client:
-            response = await client.get(target_url)
+        await upstream.aread()
+        await upstream.aclose()
+        await client.aclose()
+        if upstream.status_code == 200:
+            # Restituisci la risposta JSON (es. stato "processing")
+            return upstream.json()
 
-            logger.info(
-                f"Risposta da gateway: status={response.status_code}, content-type={response.headers.get('content-type')}")
-
-            if response.status_code == 200:
-                content_type = response.headers.get('content-type', '')
-                if content_type.startswith('audio/'):
-                    # Restituisci il file audio
-                    return Response(
-                        content=response.content,
-                        media_type=content_type,
-                        headers=dict(response.headers)
-                    )
-                else:
-                    # Restituisci la risposta JSON (es. stato "processing")
-                    return response.json()
-            else:
-                logger.error(f"Errore nella risposta dal gateway: {response.status_code} - {response.text}")
-                return {"detail": response.text or "Errore nel recupero dell'audio"}
+        logger.error(f"Errore nella risposta dal gateway: {upstream.status_code} - {upstream.text}")
+        return JSONResponse(
+            status_code=upstream.status_code,
+            content={"detail": upstream.text or "Errore nel recupero dell'audio", "status": "error"},
+            headers={name: upstream.headers[name] for name in AUDIO_RESPONSE_HEADERS if name in upstream.headers}
+        )
 
     except Exception as e:
+        await client.aclose()
         logger.error(f"Errore nel proxy dell'audio {audio_id}: {e}")
         return {"detail": str(e), "status": "error"}
 
+
+@app.get("/api/tts/audio/{audio_id}/wait")
+async def proxy_audio_wait(audio_id: str, timeout: float = 25.0):
+    """Inoltra il long-poll sullo stato della sintesi: una sola richiesta per attesa invece del polling."""
+    try:
+        target_url = f"{API_GATEWAY_URL}/api/tts/audio/{audio_id}/wait"
+        async with httpx.AsyncClient(timeout=timeout + 10) as client:
+            response = await client.get(target_url, params={"timeout": timeout})
+        return JSONResponse(status_code=response.status_code, content=response.json())
+
+    except Exception as e:
+        logger.error(f"Errore nell'attesa dell'audio {audio_id}: {e}")
+        return JSONResponse(status_code=502, content={"detail": str(e), "status": "error"})
+
+
 if __name__ == "__main__":
     print(f"Starting frontend service on port: {PORT}")
     uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True)
\ No newline at end of file
@@ -467,6 +467,13 @@ function createDebugDiv() {
     }
 
     // Funzione per verificare e riprodurre l'audio con polling
+    // Formato audio compresso supportato dal browser: riduce i dati scaricati rispetto al WAV
+    function preferredAudioFormat() {
+        if (responseAudio.canPlayType('audio/ogg; codecs="opus"')) return 'opus';
+        if (responseAudio.canPlayType('audio/mpeg')) return 'mp3';
+        return 'wav';
+    }
+
     function checkAndPlayAudio(audioUrl) {
         if (!audioUrl) return;
 
@@ -485,57 +492,45 @@ function createDebugDiv() {
         audioContainer.innerHTML = '<div class="audio-loading"><i class="fas fa-music"></i><div class="audio-wave"><span></span><span></span><span></span><span></span></div></div>';
         audioContainer.style.display = 'flex';
 
-        // Funzione per verificare lo stato dell'audio
-        async function pollAudioStatus() {
+        // Attende la fine della sintesi con long-poll: il server risponde appena l'audio è pronto
+        async function waitForAudio() {
             try {
-                const response = await fetch(relativeAudioUrl);
+                const response = await fetch(`${relativeAudioUrl}/wait?timeout=25`);
 
                 if (response.status === 200) {
-                    if (response.headers.get('content-type')?.includes('audio/')) {
+                    const data = await response.json();
+                    console.log("Stato della sintesi:", data);
+
+                    if (data.status === "done") {
                         // Audio pronto, riproduci
                         console.log("Audio pronto, riproduzione in corso");
-                        responseAudio.src = relativeAudioUrl;
+                        responseAudio.src = `${relativeAudioUrl}?format=${preferredAudioFormat()}`;
                         audioContainer.innerHTML = ''; // Rimuovi animazione
                         audioContainer.appendChild(responseAudio);
                         responseAudio.style.display = 'block';
                         responseAudio.play();
-                        return true;
+                    } else if (data.status === "failed") {
+                        // Gestisci l'errore
+                        console.error("Errore dal server:", data.error || "Errore sconosciuto");
+                        audioContainer.innerHTML = '<div class="audio-error"><i class="fas fa-exclamation-circle"></i> Errore nella generazione audio</div>';
+                        setTimeout(() => { audioContainer.style.display = 'none'; }, 3000);
                     } else {
-                        // Controlla se è in elaborazione o errore
-                        const data = await response.json();
-                        console.log("Risposta ricevuta:", data);
-
-                        if (data.status === "processing") {
-                            console.log("Audio in elaborazione, riprovo tra 1 secondo");
-                            setTimeout(pollAudioStatus, 1000);
-                            return false;
-                        } else if (data.status === "error") {
-                            // Gestisci l'errore
-                            console.error("Errore dal server:", data.detail || "Errore sconosciuto");
-                            audioContainer.innerHTML = '<div class="audio-error"><i class="fas fa-exclamation-circle"></i> Errore nella generazione audio</div>';
-                            setTimeout(() => { audioContainer.style.display = 'none'; }, 3000);
-                            return false;
-                        } else {
-                            console.error("Formato di risposta inaspettato:", data);
-                            audioContainer.style.display = 'none';
-                            return false;
-                        }
+                        // Ancora in coda o in sintesi allo scadere dell'attesa: nuova richiesta
+                        waitForAudio();
                     }
                 } else {
                     console.error("Errore nella richiesta:", response.status);
                     audioContainer.innerHTML = '<div class="audio-error"><i class="fas fa-exclamation-circle"></i> Errore: ' + response.status + '</div>';
                     setTimeout(() => { audioContainer.style.display = 'none'; }, 3000);
-                    return false;
                 }
             } catch (error) {
-                console.error("Errore durante il controllo dell'audio:", error);
-                setTimeout(pollAudioStatus, 2000); // Riprova con un intervallo più lungo in caso di errore
-                return false;
+                console.error("Errore durante l'attesa dell'audio:", error);
+                setTimeout(waitForAudio, 2000); // Riprova con un intervallo più lungo in caso di errore
             }
         }
 
-        // Avvia il polling
-        pollAudioStatus();
+        // Avvia l'attesa
+        waitForAudio();
     }
 
     // Funzione per creare il container audio se non esiste
@@ -1,17 +1,58 @@
 #TODO: Implementare
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from faster_whisper import WhisperModel
-import tempfile
+import asyncio
+import json
 import os
 import uvicorn
 import logging
 from pydantic import BaseModel
 from typing import Optional
+from executor import ExecutorBusy, InferenceExecutor
+from model_pool import PoolFull, WhisperModelPool, parse_tiers
+from preprocess import AudioTooLong
+from streaming import TranscriptionStream, create_decoder
+from vad import StreamingSegmenter
+from whisper_batch import FALLBACK_TEMPERATURES, BatchedWhisper, log_mel
+import pipeline
 
 # Configurazione
 PORT = int(os.getenv("STT_SERVICE_PORT", 5001))
-MODEL_SIZE = "base" #os.getenv("WHISPER_MODEL_SIZE", "base")  # tiny, base, small, medium, large
+MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")  # tiny, base, small, medium, large-v2
+# Livelli di latenza selezionabili per richiesta e dimensioni ammesse nel pool
+WHISPER_TIERS = parse_tiers(os.getenv("WHISPER_TIERS", "fast:tiny,balanced:base,accurate:small"))
+WHISPER_ALLOWED_SIZES = os.getenv("WHISPER_ALLOWED_SIZES", "tiny,base,small").split(",")
+# Budget di memoria per i modelli residenti; il modello predefinito non viene mai rimosso
+WHISPER_MEMORY_BUDGET_MB = int(os.getenv("WHISPER_MEMORY_BUDGET_MB", 1024))
+EXECUTOR_KIND = os.getenv("EXECUTOR_KIND", "thread")  # thread, process
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 1))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", 16))
+# Thread CTranslate2 per decodifica (0 = predefinito) e decodifiche parallele per processo
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", 0))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", 1))
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", 5))
+# Controlli di model.transcribe: blocchi con <|nospeech|> probabile scartati, ridecodifica a temperature crescenti
+WHISPER_NO_SPEECH_THRESHOLD = float(os.getenv("WHISPER_NO_SPEECH_THRESHOLD", 0.6))
+WHISPER_TEMPERATURE_FALLBACK = os.getenv("WHISPER_TEMPERATURE_FALLBACK", "true").lower() == "true"
+# Micro-batching dei blocchi da 30 s tra richieste diverse
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 20))
+LANGUAGE = os.getenv("WHISPER_LANGUAGE", "it")
+# Durata massima dell'audio caricato (0 = nessun limite): oltre il limite si tronca o si rifiuta
+MAX_AUDIO_SECONDS = float(os.getenv("MAX_AUDIO_SECONDS", 300))
+MAX_AUDIO_POLICY = os.getenv("MAX_AUDIO_POLICY", "truncate")  # truncate, reject
+if MAX_AUDIO_POLICY not in ("truncate", "reject"):
+    raise ValueError(f"MAX_AUDIO_POLICY non valido: {MAX_AUDIO_POLICY}")
+# VAD Silero prima di Whisper: silenzio iniziale/finale e pause lunghe non vengono trascritti
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", 0.5))
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", 500))
+VAD_SPEECH_PAD_MS = int(os.getenv("VAD_SPEECH_PAD_MS", 400))
+# Streaming via WebSocket: soglia VAD, silenzio che chiude un segmento, durata massima e intervallo dei parziali
+STREAM_VAD_THRESHOLD_DBFS = float(os.getenv("STREAM_VAD_THRESHOLD_DBFS", -45))
+STREAM_MIN_SILENCE_MS = int(os.getenv("STREAM_MIN_SILENCE_MS", 600))
+STREAM_MAX_SEGMENT_SECONDS = float(os.getenv("STREAM_MAX_SEGMENT_SECONDS", 20))
+STREAM_PARTIAL_INTERVAL_SECONDS = float(os.getenv("STREAM_PARTIAL_INTERVAL_SECONDS", 1.0))
 
 # Configurazione logging
 logging.basicConfig(
@@ -30,10 +71,44 @@ except Exception as e:
     logger.error(f"Errore nel caricamento del modello Whisper: {e}")
     model = None
 """
-# Inizializzazione del modello Whisper
+
+
+def load_whisper(size):
+    """Carica un modello Whisper e lo avvolge nel decoder a batch."""
+    model = WhisperModel(
+        size,
+        device="cpu",
+        compute_type="int8",
+        cpu_threads=WHISPER_CPU_THREADS,
+        num_workers=WHISPER_NUM_WORKERS
+    )
+    return BatchedWhisper(
+        model,
+        LANGUAGE,
+        beam_size=WHISPER_BEAM_SIZE,
+        temperatures=FALLBACK_TEMPERATURES if WHISPER_TEMPERATURE_FALLBACK else (),
+        no_speech_threshold=WHISPER_NO_SPEECH_THRESHOLD,
+    )
+
+
+# Pool dei modelli Whisper: ogni modello ha il proprio worker a batch
+model_pool = WhisperModelPool(
+    load_whisper,
+    default_size=MODEL_SIZE,
+    tiers=WHISPER_TIERS,
+    allowed_sizes=WHISPER_ALLOWED_SIZES,
+    memory_budget_mb=WHISPER_MEMORY_BUDGET_MB,
+    batcher_options={
+        "max_batch_size": BATCH_MAX_SIZE,
+        "max_wait_ms": BATCH_MAX_WAIT_MS,
+        "max_concurrent_batches": WHISPER_NUM_WORKERS,
+    },
+)
+
+# Inizializzazione del modello Whisper predefinito
 try:
-    logger.info(f"Caricamento del modello Whisper '{MODEL_SIZE}'...")
-    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
+    model_pool.load_default()
+    model = model_pool.entries[MODEL_SIZE]
     logger.info(f"Modello Whisper caricato con successo.")
 except Exception as e:
     logger.error(f"Errore nel caricamento del modello Whisper: {e}")
@@ -41,7 +116,20 @@ except Exception as e:
 
 app = FastAPI(title="Speech-to-Text Service")
 
-LANGUAGE = os.getenv("WHISPER_LANGUAGE", "it")
+# Parametri di decodifica e VAD della pipeline nel processo principale (modalità "thread")
+PIPELINE_OPTIONS = (MAX_AUDIO_SECONDS, MAX_AUDIO_POLICY, VAD_THRESHOLD, VAD_MIN_SILENCE_MS, VAD_SPEECH_PAD_MS)
+pipeline.configure(*PIPELINE_OPTIONS)
+
+# Executor per decodifica, VAD e mel: il lavoro CPU-bound non blocca l'event loop.
+# In modalità "process" i figli non caricano Whisper: la decodifica a batch resta nel servizio
+stt_executor = InferenceExecutor(
+    EXECUTOR_KIND,
+    EXECUTOR_WORKERS,
+    EXECUTOR_QUEUE_SIZE,
+    name="stt",
+    initializer=pipeline.configure if EXECUTOR_KIND == "process" else None,
+    initargs=PIPELINE_OPTIONS,
+)
 
 # Configurare CORS
 app.add_middleware(
@@ -57,6 +145,49 @@ class TranscriptionResponse(BaseModel):
     text: str
     language: Optional[str] = None
     confidence: Optional[float] = None
+    model: Optional[str] = None
+    audio_seconds: Optional[float] = None
+    speech_seconds: Optional[float] = None
+    skipped_seconds: Optional[float] = None
+    truncated: Optional[bool] = None
+
+
+async def transcribe_chunks(batcher, mels):
+    """Accoda i blocchi al worker a batch e ricompone il testo nell'ordine originale."""
+    texts = await asyncio.gather(*(batcher.submit(mel) for mel in mels))
+    return " ".join(text for text in texts if text)
+
+
+def resolve_model(model, tier):
+    try:
+        return model_pool.resolve(model, tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Stato delle sessioni di streaming
+stream_stats = {"active": 0, "total": 0, "audio_seconds": 0.0}
+# Audio trascritto tramite il worker a batch, per il calcolo del throughput
+transcription_stats = {"requests": 0, "chunks": 0, "audio_seconds": 0.0}
+# Audio non inviato a Whisper: non parlato scartato dal VAD e audio oltre la durata massima
+preprocess_stats = {
+    "speech_seconds": 0.0,
+    "silence_skipped_seconds": 0.0,
+    "over_limit_skipped_seconds": 0.0,
+    "truncated": 0,
+    "rejected": 0,
+}
+
+
+@app.on_event("startup")
+async def start_batcher():
+    await model_pool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    await model_pool.stop()
+    stt_executor.shutdown()
 
 
 @app.get("/health")
@@ -66,28 +197,56 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Restituisce executor, batching, streaming e throughput (secondi di audio per secondo di calcolo)."""
+    batching = model_pool.batching_stats()
+    busy_seconds = sum(stats["busy_seconds"] for stats in batching.values())
+    throughput = dict(transcription_stats)
+    throughput["audio_seconds_per_busy_second"] = (
+        throughput["audio_seconds"] / busy_seconds if busy_seconds else 0.0
+    )
+    return {
+        "executor": stt_executor.stats(),
+        "batching": batching,
+        "streaming": dict(stream_stats),
+        "throughput": throughput,
+        "preprocess": dict(preprocess_stats),
+    }
+
+
+@app.get("/models")
+async def get_models():
+    """Restituisce i modelli Whisper residenti, i livelli configurati e il budget di memoria."""
+    return model_pool.stats()
+
+
 @app.post("/transcribe", response_model=TranscriptionResponse)
-async def transcribe_audio(audio_file: UploadFile = File(...)):
-    if model is None:
+async def transcribe_audio(
+    audio_file: UploadFile = File(...),
+    model: Optional[str] = Query(None, description="Dimensione del modello, es. tiny, base, small"),
+    tier: Optional[str] = Query(None, description="Livello di latenza, es. fast, balanced, accurate"),
+):
+    if model_pool.entries.get(MODEL_SIZE) is None:
         raise HTTPException(status_code=500, detail="Modello Whisper non disponibile")
+    size = resolve_model(model, tier)
 
     try:
-        # Salva temporaneamente il file audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-            content = await audio_file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        content = await audio_file.read()
 
-        logger.info(f"File audio temporaneo salvato in: {temp_file_path}")
+        async with model_pool.use(size) as whisper:
+            # Decodifica e segmentazione fuori dall'event loop (mel con le bande del modello scelto),
+            # poi decodifica Whisper a batch
+            mels, audio_info = await stt_executor.run(pipeline.prepare_chunks, content, whisper.batched.n_mels)
+            for key in ("speech_seconds", "silence_skipped_seconds", "over_limit_skipped_seconds"):
+                preprocess_stats[key] += audio_info[key]
+            preprocess_stats["truncated"] += int(audio_info["truncated"])
 
-        # Esegui la trascrizione
-        #result = model.transcribe(temp_file_path, language=LANGUAGE)
-        segments, info = model.transcribe(temp_file_path, language=LANGUAGE)
-        text = " ".join([segment.text for segment in segments])
-        result = {"text": text, "language": info.language}
+            result = {"text": await transcribe_chunks(whisper.batcher, mels), "language": LANGUAGE}
 
-        # Pulizia del file temporaneo
-        os.unlink(temp_file_path)
+        transcription_stats["requests"] += 1
+        transcription_stats["chunks"] += len(mels)
+        transcription_stats["audio_seconds"] += audio_info["audio_seconds"]
 
         text = result.get("text", "").strip()
         language = result.get("language")
@@ -97,14 +256,126 @@ async def transcribe_audio(audio_file: UploadFile = File(...)):
         return {
             "text": text,
             "language": language,
-            "confidence": 1.0
+            "confidence": 1.0,
+            "model": size,
+            "audio_seconds": audio_info["audio_seconds"],
+            "speech_seconds": audio_info["speech_seconds"],
+            "skipped_seconds": round(
+                audio_info["silence_skipped_seconds"] + audio_info["over_limit_skipped_seconds"], 2
+            ),
+            "truncated": audio_info["truncated"]
         }
 
+    except AudioTooLong as e:
+        preprocess_stats["rejected"] += 1
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ExecutorBusy, PoolFull) as e:
+        raise HTTPException(status_code=503, detail=f"Servizio occupato, riprovare più tardi: {str(e)}")
     except Exception as e:
         logger.error(f"Errore durante la trascrizione: {e}")
         raise HTTPException(status_code=500, detail=f"Errore durante la trascrizione: {str(e)}")
 
 
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(
+    websocket: WebSocket,
+    format: str = "pcm16",
+    sample_rate: int = 16000,
+    model: Optional[str] = None,
+    tier: Optional[str] = None,
+):
+    """Trascrizione incrementale: il client invia blocchi audio binari e infine il testo "stop".
+
+    `format` è "pcm16" (little-endian mono a `sample_rate`) oppure "webm"/"ogg"/"opus"
+    (ad esempio i blocchi di MediaRecorder). Il server risponde con messaggi JSON
+    `partial` e `final` per ogni segmento di parlato e `done` con il testo completo.
+    """
+    await websocket.accept()
+    if model_pool.entries.get(MODEL_SIZE) is None:
+        await websocket.send_json({"type": "error", "detail": "Modello Whisper non disponibile"})
+        await websocket.close(code=1011)
+        return
+
+    try:
+        size = model_pool.resolve(model, tier)
+        decoder = create_decoder(format, sample_rate)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    async def transcribe_segment(audio, final):
+        # Parziali e segmenti conclusi condividono il worker a batch con le altre richieste
+        mel = await stt_executor.run(log_mel, audio, whisper.batched.n_mels)
+        text = await whisper.batcher.submit(mel)
+        if final:
+            transcription_stats["chunks"] += 1
+            transcription_stats["audio_seconds"] += len(audio) / 16000
+        return text
+
+    stream = TranscriptionStream(
+        decoder,
+        StreamingSegmenter(
+            threshold_dbfs=STREAM_VAD_THRESHOLD_DBFS,
+            min_silence_ms=STREAM_MIN_SILENCE_MS,
+            max_segment_seconds=STREAM_MAX_SEGMENT_SECONDS,
+        ),
+        transcribe_segment,
+        websocket.send_json,
+        partial_interval_seconds=STREAM_PARTIAL_INTERVAL_SECONDS,
+    )
+
+    stream_stats["active"] += 1
+    stream_stats["total"] += 1
+    try:
+        # Il modello resta riservato per tutta la sessione e non può essere rimosso dal pool
+        async with model_pool.use(size) as whisper:
+            await stream.start()
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("bytes") is not None:
+                    await stream.feed(message["bytes"])
+                elif is_stop_message(message.get("text")):
+                    break
+
+            text = await stream.finish()
+        logger.info(f"Streaming completato: {stream.audio_seconds:.1f} s di audio, {stream.segment_index} segmenti")
+        await websocket.send_json({"type": "done", "text": text, "language": LANGUAGE, "model": size})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        logger.info("Client disconnesso durante lo streaming")
+        stream.abort()
+    except Exception as e:
+        logger.error(f"Errore durante la trascrizione in streaming: {e}")
+        stream.abort()
+        busy = isinstance(e, (ExecutorBusy, PoolFull))
+        try:
+            await websocket.send_json({"type": "error", "detail": "Servizio occupato" if busy else str(e)})
+            await websocket.close(code=1013 if busy else 1011)
+        except Exception:
+            # Connessione già chiusa dal client
+            pass
+    finally:
+        stream_stats["active"] -= 1
+        stream_stats["audio_seconds"] += stream.audio_seconds
+
+
+def is_stop_message(text):
+    """Riconosce il messaggio di fine stream: "stop" oppure {"event": "stop"}."""
+    if text is None:
+        return False
+    if text.strip().lower() == "stop":
+        return True
+    try:
+        return json.loads(text).get("event") == "stop"
+    except (ValueError, AttributeError):
+        return False
+
+
 if __name__ == "__main__":
     print(f"Avvio del servizio STT sulla porta {PORT}")
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True)
\ No newline at end of file
+    # Senza reload: in produzione il servizio si avvia con `uvicorn app:app --app-dir src` (vedi Dockerfile)
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Raccoglie le richieste concorrenti e le esegue in un unico forward pass.
+
+    Ogni richiesta accoda un singolo campione (senza dimensione batch). Il worker
+    attende al massimo `max_wait_ms` millisecondi, o finché non si raggiungono
+    `max_batch_size` campioni, poi impila gli input, chiama `predict_fn` una sola
+    volta e restituisce a ciascuna richiesta la riga corrispondente dell'output.
+    Fino a `max_concurrent_batches` batch possono essere in esecuzione insieme
+    (ad esempio uno per ogni worker CTranslate2).
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        max_concurrent_batches: int = 1,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        # Un thread dedicato per ogni batch concorrente
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=self.max_concurrent_batches, thread_name_prefix="batcher"
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metriche
+        self.total_requests = 0
+        self.total_batches = 0
+        self.total_errors = 0
+        self.last_batch_size = 0
+        self.max_queue_depth = 0
+        self.total_batch_seconds = 0.0
+        self.batch_size_histogram: Dict[int, int] = {}
+        # Tempo in cui almeno un batch era in esecuzione
+        self.busy_seconds = 0.0
+        self._active_batches = 0
+        self._busy_since = 0.0
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._batch_ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batcher avviato (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}, max_concurrent_batches={self.max_concurrent_batches})"
+        )
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Le richieste ancora in coda non verranno mai servite
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher arrestato"))
+
+    def shutdown(self, wait: bool = True):
+        """Chiude i thread del batcher (solo se l'executor è stato creato qui); da chiamare dopo `stop`."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    async def submit(self, sample: np.ndarray) -> np.ndarray:
+        """Accoda un singolo campione e attende la riga di output corrispondente."""
+        if self._worker is None:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sample, future))
+        self.total_requests += 1
+
+        depth = self._queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        # Il worker ha già prelevato il primo campione del batch in formazione
+        if depth >= self.max_batch_size - 1:
+            self._batch_ready.set()
+
+        return await future
+
+    async def run_batch(self, inputs: np.ndarray) -> np.ndarray:
+        """Esegue un batch già formato sullo stesso thread di inferenza dei micro-batch."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.predict_fn, inputs)
+
+    async def _run(self):
+        while True:
+            # Un nuovo batch si forma solo quando c'è un worker libero ad eseguirlo
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+
+            # Attendi altre richieste finché il batch non è pieno o scade l'attesa
+            if self.max_wait > 0 and len(batch) + self._queue.qsize() < self.max_batch_size:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # Le richieste annullate (es. client disconnesso) non occupano il batch
+            batch = [(sample, future) for sample, future in batch if not future.cancelled()]
+            if batch:
+                asyncio.create_task(self._process(batch))
+            else:
+                self._slots.release()
+
+    async def _process(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self._active_batches == 0:
+            self._busy_since = start
+        self._active_batches += 1
+        try:
+            inputs = np.stack([sample for sample, _ in batch])
+            outputs = await loop.run_in_executor(self._executor, self.predict_fn, inputs)
+            if len(outputs) != len(batch):
+                # Con zip le richieste senza riga di output resterebbero in attesa per sempre
+                raise RuntimeError(f"Il modello ha restituito {len(outputs)} righe per {len(batch)} campioni")
+        except Exception as e:
+            logger.error(f"Errore durante l'esecuzione del batch di {len(batch)} campioni: {e}")
+            self.total_errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._active_batches -= 1
+            if self._active_batches == 0:
+                self.busy_seconds += time.perf_counter() - self._busy_since
+            self._slots.release()
+
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+        size = len(batch)
+        self.total_batches += 1
+        self.last_batch_size = size
+        self.total_batch_seconds += time.perf_counter() - start
+        self.batch_size_histogram[size] = self.batch_size_histogram.get(size, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Restituisce le metriche di coda e dimensione dei batch."""
+        served = sum(size * count for size, count in self.batch_size_histogram.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "total_errors": self.total_errors,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": served / self.total_batches if self.total_batches else 0.0,
+            "avg_batch_latency_ms": (
+                self.total_batch_seconds / self.total_batches * 1000 if self.total_batches else 0.0
+            ),
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "active_batches": self._active_batches,
+            "busy_seconds": self.busy_seconds,
+        }
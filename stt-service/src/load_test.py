@@ -0,0 +1,79 @@
+"""Prova di carico per /transcribe: throughput in secondi di audio per secondo reale.
+
+    python src/load_test.py --file sample.wav --concurrency 8 --requests 32
+
+Invia richieste concorrenti con lo stesso file e riporta latenza e throughput
+misurati dal client, insieme alle metriche di batching del servizio.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+
+def audio_duration(path, fallback):
+    try:
+        with wave.open(path) as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (wave.Error, EOFError):
+        return fallback
+
+
+def post_file(url, path, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="audio_file"; filename="{os.path.basename(path)}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico dello stt-service")
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--audio-seconds", type=float, default=0.0,
+                        help="Durata del file se non è un WAV leggibile")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        content = f.read()
+    duration = audio_duration(args.file, args.audio_seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(lambda _: post_file(f"{args.url}/transcribe", args.file, content),
+                                    range(args.requests)))
+    wall = time.perf_counter() - start
+
+    with urllib.request.urlopen(f"{args.url}/metrics") as response:
+        metrics = json.load(response)
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": wall,
+        "audio_seconds": duration * args.requests,
+        "audio_seconds_per_wall_second": duration * args.requests / wall if duration else None,
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "latency_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "service_throughput": metrics.get("throughput"),
+        "service_batching": metrics.get("batching"),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
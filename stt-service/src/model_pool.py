@@ -0,0 +1,209 @@
+"""Pool di modelli Whisper caricati su richiesta.
+
+Ogni dimensione (tiny, base, small, ...) viene caricata al primo utilizzo con
+il proprio worker a batch. Il modello predefinito resta sempre residente; gli
+altri vengono rimossi, dal meno usato di recente, quando un nuovo caricamento
+supererebbe il budget di memoria e non hanno richieste in corso.
+"""
+import asyncio
+import gc
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Memoria residente stimata (MB) dei modelli CTranslate2 int8 su CPU
+MODEL_MEMORY_MB = {
+    "tiny": 75,
+    "base": 145,
+    "small": 480,
+    "medium": 1500,
+    "large-v1": 3100,
+    "large-v2": 3100,
+}
+
+
+class PoolFull(Exception):
+    """Nessun modello inattivo da rimuovere per rientrare nel budget di memoria."""
+
+
+class PooledModel:
+    def __init__(self, size: str, batched, batcher: MicroBatcher, load_seconds: float, pinned: bool):
+        self.size = size
+        self.batched = batched
+        self.batcher = batcher
+        self.load_seconds = load_seconds
+        self.pinned = pinned
+        self.memory_mb = MODEL_MEMORY_MB.get(size, 0)
+        self.in_use = 0
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+def parse_tiers(value: Optional[str]) -> Dict[str, str]:
+    """Legge i livelli di latenza da una stringa "nome:dimensione,..."."""
+    tiers = {}
+    for part in (value or "").split(","):
+        name, _, size = part.partition(":")
+        if name.strip() and size.strip():
+            tiers[name.strip()] = size.strip()
+    return tiers
+
+
+class WhisperModelPool:
+    """Modelli Whisper residenti, con caricamento pigro ed eviction LRU sotto budget."""
+
+    def __init__(
+        self,
+        load_model: Callable[[str], Any],
+        default_size: str,
+        tiers: Dict[str, str],
+        allowed_sizes: Iterable[str],
+        memory_budget_mb: int,
+        batcher_options: Dict[str, Any],
+    ):
+        self.load_model = load_model
+        self.default_size = default_size
+        self.tiers = tiers
+        self.allowed_sizes = set(allowed_sizes) | {default_size} | set(tiers.values())
+        self.memory_budget_mb = memory_budget_mb
+        self.batcher_options = batcher_options
+
+        self.entries: "OrderedDict[str, PooledModel]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Verifica del budget e prenotazione della memoria avvengono sotto un unico lock del pool
+        self._room_lock = asyncio.Lock()
+        # Memoria prenotata dai caricamenti in corso, non ancora in `entries`
+        self._loading_mb: Dict[str, int] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve(self, model: Optional[str] = None, tier: Optional[str] = None) -> str:
+        """Dimensione del modello richiesta esplicitamente o tramite livello di latenza."""
+        if model:
+            if model not in self.allowed_sizes:
+                raise ValueError(f"Modello Whisper non disponibile: {model}")
+            return model
+        if tier:
+            if tier not in self.tiers:
+                raise ValueError(f"Livello sconosciuto: {tier}")
+            return self.tiers[tier]
+        return self.default_size
+
+    def load_default(self):
+        """Carica il modello predefinito in modo sincrono, all'avvio del servizio."""
+        self.entries[self.default_size] = self._load(self.default_size, pinned=True)
+
+    def _load(self, size: str, pinned: bool = False) -> PooledModel:
+        logger.info(f"Caricamento del modello Whisper '{size}'...")
+        start = time.perf_counter()
+        batched = self.load_model(size)
+        load_seconds = time.perf_counter() - start
+        logger.info(f"Modello Whisper '{size}' caricato in {load_seconds:.1f} s")
+        self.loads += 1
+        return PooledModel(size, batched, MicroBatcher(batched, **self.batcher_options), load_seconds, pinned)
+
+    @asynccontextmanager
+    async def use(self, size: str):
+        """Riserva il modello per la durata del blocco: un modello in uso non viene rimosso."""
+        entry = await self._get(size)
+        entry.in_use += 1
+        try:
+            yield entry
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.time()
+
+    async def _get(self, size: str) -> PooledModel:
+        entry = self.entries.get(size)
+        if entry is None:
+            lock = self._locks.setdefault(size, asyncio.Lock())
+            async with lock:
+                entry = self.entries.get(size)
+                if entry is None:
+                    async with self._room_lock:
+                        await self._make_room(MODEL_MEMORY_MB.get(size, 0))
+                        self._loading_mb[size] = MODEL_MEMORY_MB.get(size, 0)
+                    try:
+                        loop = asyncio.get_running_loop()
+                        entry = await loop.run_in_executor(None, self._load, size)
+                        await entry.batcher.start()
+                        self.entries[size] = entry
+                    finally:
+                        self._loading_mb.pop(size, None)
+        self.entries.move_to_end(size)
+        return entry
+
+    @property
+    def resident_mb(self) -> int:
+        return sum(entry.memory_mb for entry in self.entries.values())
+
+    @property
+    def reserved_mb(self) -> int:
+        """Memoria dei modelli residenti più quella prenotata dai caricamenti in corso."""
+        return self.resident_mb + sum(self._loading_mb.values())
+
+    async def _make_room(self, needed_mb: int):
+        """Rimuove modelli inattivi finché il nuovo caricamento rientra nel budget; va chiamata con `_room_lock`."""
+        while self.reserved_mb + needed_mb > self.memory_budget_mb:
+            # Ordine LRU: il primo modello inattivo e non fissato è il candidato
+            victim = next((e for e in self.entries.values() if not e.pinned and e.in_use == 0), None)
+            if victim is None:
+                raise PoolFull(
+                    f"Budget di {self.memory_budget_mb} MB esaurito: nessun modello inattivo da rimuovere"
+                )
+            await self.evict(victim.size)
+
+    async def evict(self, size: str):
+        entry = self.entries.pop(size)
+        await entry.batcher.stop()
+        # Chiusura esplicita dei thread del batcher: il rilascio del modello non dipende dal GC
+        await asyncio.get_running_loop().run_in_executor(None, entry.batcher.shutdown)
+        del entry
+        gc.collect()
+        self.evictions += 1
+        logger.info(f"Modello Whisper '{size}' rimosso dalla memoria")
+
+    async def start(self):
+        for entry in self.entries.values():
+            await entry.batcher.start()
+
+    async def stop(self):
+        for entry in self.entries.values():
+            await entry.batcher.stop()
+            entry.batcher.shutdown(wait=False)
+
+    def batching_stats(self) -> Dict[str, Any]:
+        return {
+            size: {**entry.batcher.stats(), "decoding": dict(entry.batched.stats)}
+            for size, entry in self.entries.items()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default_size,
+            "tiers": self.tiers,
+            "available": sorted(self.allowed_sizes),
+            "memory_budget_mb": self.memory_budget_mb,
+            "resident_mb": self.resident_mb,
+            "loading_mb": sum(self._loading_mb.values()),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "resident": [
+                {
+                    "size": entry.size,
+                    "pinned": entry.pinned,
+                    "in_use": entry.in_use,
+                    "memory_mb": entry.memory_mb,
+                    "load_seconds": entry.load_seconds,
+                    "loaded_at": entry.loaded_at,
+                    "last_used": entry.last_used,
+                }
+                for entry in self.entries.values()
+            ],
+        }
@@ -0,0 +1,46 @@
+"""Decodifica, VAD e mel-spectrogram eseguiti nell'executor.
+
+Modulo leggero, separato dall'app FastAPI: in modalità "process" i processi
+figli (avviati con spawn) importano solo questo modulo, senza caricare i
+modelli Whisper, che restano nel processo del servizio. I parametri vengono
+impostati con `configure`, dall'app o come initializer dei processi del pool.
+
+Con spawn i figli rieseguono anche lo script principale: il servizio va avviato
+con `uvicorn app:app --app-dir src` (come nel Dockerfile), non con `python src/app.py`.
+"""
+from preprocess import AudioTooLong, decode_capped
+from whisper_batch import SAMPLE_RATE, log_mel, split_speech
+
+max_audio_seconds = 300.0
+max_audio_policy = "truncate"
+vad_options = {"threshold": 0.5, "min_silence_ms": 500, "speech_pad_ms": 400}
+
+
+def configure(max_seconds, policy, vad_threshold, vad_min_silence_ms, vad_speech_pad_ms):
+    """Imposta durata massima e parametri del VAD (anche initializer dei processi del pool)."""
+    global max_audio_seconds, max_audio_policy, vad_options
+    max_audio_seconds = max_seconds
+    max_audio_policy = policy
+    vad_options = {"threshold": vad_threshold, "min_silence_ms": vad_min_silence_ms, "speech_pad_ms": vad_speech_pad_ms}
+
+
+def prepare_chunks(content, n_mels):
+    """Decodifica (entro la durata massima), scarta il non parlato e calcola i mel dei blocchi.
+
+    Restituisce i mel-spectrogram e le durate in secondi: audio decodificato,
+    parlato inviato a Whisper, audio scartato dal VAD e oltre il limite.
+    """
+    audio, truncated, declared = decode_capped(content, max_audio_seconds)
+    if truncated and max_audio_policy == "reject":
+        raise AudioTooLong(f"L'audio supera la durata massima di {max_audio_seconds:.0f} s")
+
+    chunks = split_speech(audio, **vad_options)
+    audio_seconds = len(audio) / SAMPLE_RATE
+    speech_seconds = sum(len(chunk) for chunk in chunks) / SAMPLE_RATE
+    return [log_mel(chunk, n_mels) for chunk in chunks], {
+        "audio_seconds": round(audio_seconds, 2),
+        "speech_seconds": round(speech_seconds, 2),
+        "silence_skipped_seconds": round(audio_seconds - speech_seconds, 2),
+        "over_limit_skipped_seconds": round(max(0.0, declared - audio_seconds), 2) if truncated and declared else 0.0,
+        "truncated": truncated,
+    }
@@ -0,0 +1,52 @@
+"""Decodifica con limite di durata per lo stt-service.
+
+A differenza di `faster_whisper.decode_audio`, la decodifica si ferma appena
+viene superata la durata massima: un file troppo lungo non viene decodificato
+per intero solo per essere poi troncato o rifiutato.
+"""
+import io
+from typing import Optional, Tuple
+
+import av
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class AudioTooLong(Exception):
+    """L'audio supera la durata massima consentita."""
+
+
+def decode_capped(content: bytes, max_seconds: float) -> Tuple[np.ndarray, bool, Optional[float]]:
+    """Decodifica in float32 16 kHz mono al massimo `max_seconds` secondi (0 = nessun limite).
+
+    Restituisce l'audio, se è stato troncato e la durata dichiarata dal container
+    (None se il container non la riporta, come nei WebM di MediaRecorder).
+    """
+    max_samples = int(max_seconds * SAMPLE_RATE) if max_seconds > 0 else None
+    parts = []
+    total = 0
+    truncated = False
+
+    with av.open(io.BytesIO(content), metadata_errors="ignore") as container:
+        declared = container.duration / av.time_base if container.duration else None
+        resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                array = resampled.to_ndarray().reshape(-1)
+                parts.append(array)
+                total += len(array)
+            if max_samples is not None and total > max_samples:
+                truncated = True
+                break
+
+        if not truncated:
+            # Svuota il buffer interno del resampler
+            for resampled in resampler.resample(None):
+                parts.append(resampled.to_ndarray().reshape(-1))
+
+    audio = np.concatenate(parts).astype(np.float32) / 32768.0 if parts else np.zeros(0, dtype=np.float32)
+    if truncated:
+        audio = audio[:max_samples]
+    return audio, truncated, declared
@@ -0,0 +1,221 @@
+"""Sessioni di trascrizione in streaming per il WebSocket dello stt-service.
+
+L'audio arriva a blocchi (PCM 16 bit o container WebM/Ogg con Opus), viene
+decodificato a float32 16 kHz mono, segmentato con il VAD e ogni segmento
+concluso viene trascritto mentre l'utente continua a parlare. Durante un
+segmento ancora aperto vengono inviate trascrizioni parziali a intervalli regolari.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from vad import SAMPLE_RATE, StreamingSegmenter
+
+logger = logging.getLogger(__name__)
+
+# Byte letti per volta dall'uscita di ffmpeg (~0.25 s di PCM 16 bit a 16 kHz)
+FFMPEG_READ_SIZE = 8192
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class PCM16Decoder:
+    """PCM 16 bit little-endian mono già a 16 kHz: nessuna conversione necessaria."""
+
+    def __init__(self):
+        self.output: asyncio.Queue = asyncio.Queue()
+        self._rest = b""
+
+    async def start(self):
+        pass
+
+    async def feed(self, chunk: bytes):
+        data = self._rest + chunk
+        usable = len(data) // 2 * 2
+        self._rest = data[usable:]
+        if usable:
+            await self.output.put(pcm16_to_float(data[:usable]))
+
+    async def close(self):
+        await self.output.put(None)
+
+    def kill(self):
+        pass
+
+
+class FFmpegDecoder:
+    """Un processo ffmpeg per sessione: i blocchi entrano da stdin, il PCM esce da stdout."""
+
+    def __init__(self, input_args: List[str]):
+        self.input_args = input_args
+        self.output: asyncio.Queue = asyncio.Queue()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            *self.input_args, "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        rest = b""
+        try:
+            while True:
+                data = await self.process.stdout.read(FFMPEG_READ_SIZE)
+                if not data:
+                    break
+                data = rest + data
+                usable = len(data) // 2 * 2
+                rest = data[usable:]
+                if usable:
+                    await self.output.put(pcm16_to_float(data[:usable]))
+        finally:
+            await self.output.put(None)
+
+    async def feed(self, chunk: bytes):
+        self.process.stdin.write(chunk)
+        await self.process.stdin.drain()
+
+    async def close(self):
+        if not self.process.stdin.is_closing():
+            self.process.stdin.close()
+        await self._reader
+        await self.process.wait()
+
+    def kill(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+def create_decoder(audio_format: str, sample_rate: int = SAMPLE_RATE):
+    """Decoder per il formato dichiarato dal client ("pcm16", "webm", "ogg" o "opus")."""
+    if audio_format == "pcm16":
+        if sample_rate == SAMPLE_RATE:
+            return PCM16Decoder()
+        return FFmpegDecoder(["-f", "s16le", "-ar", str(sample_rate), "-ac", "1"])
+    if audio_format in ("webm", "ogg", "opus"):
+        # ffmpeg riconosce il container dall'intestazione del primo blocco
+        return FFmpegDecoder([])
+    raise ValueError(f"Formato audio non supportato: {audio_format}")
+
+
+class TranscriptionStream:
+    """Collega decoder, VAD e trascrizione per una singola connessione WebSocket.
+
+    `transcribe(audio, final)` restituisce il testo di un segmento; `send(message)`
+    invia un messaggio JSON al client. I messaggi inviati sono:
+
+    - `{"type": "partial", "segment": i, "text": ...}` durante un segmento aperto
+    - `{"type": "final", "segment": i, "start": s, "end": e, "text": ...}` a segmento concluso
+    """
+
+    def __init__(
+        self,
+        decoder,
+        segmenter: StreamingSegmenter,
+        transcribe: Callable[[np.ndarray, bool], Awaitable[str]],
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        partial_interval_seconds: float = 1.0,
+    ):
+        self.decoder = decoder
+        self.segmenter = segmenter
+        self.transcribe = transcribe
+        self.send = send
+        self.partial_interval = int(partial_interval_seconds * SAMPLE_RATE)
+
+        self.texts: List[str] = []
+        self.segment_index = 0
+        self.audio_samples = 0
+        self._last_partial_samples = 0
+        self._partial_task: Optional[asyncio.Task] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.decoder.start()
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def feed(self, chunk: bytes):
+        if self._consumer.done():
+            # Propaga l'errore della trascrizione al ciclo di ricezione
+            self._consumer.result()
+        await self.decoder.feed(chunk)
+
+    async def finish(self) -> str:
+        """Chiude l'ingresso, trascrive l'ultimo segmento e restituisce il testo completo."""
+        await self.decoder.close()
+        await self._consumer
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+        return " ".join(self.texts)
+
+    def abort(self):
+        self.decoder.kill()
+        for task in (self._consumer, self._partial_task):
+            if task is not None:
+                task.cancel()
+
+    @property
+    def audio_seconds(self) -> float:
+        return self.audio_samples / SAMPLE_RATE
+
+    async def _consume(self):
+        while True:
+            samples = await self.decoder.output.get()
+            if samples is None:
+                break
+            self.audio_samples += len(samples)
+            for start, segment in self.segmenter.push(samples):
+                await self._final(start, segment)
+            self._maybe_partial()
+
+        tail = self.segmenter.flush()
+        if tail is not None:
+            await self._final(*tail)
+
+    async def _final(self, start: int, audio: np.ndarray):
+        # Incrementare l'indice subito rende obsoleti i parziali ancora in corso
+        index = self.segment_index
+        self.segment_index += 1
+        self._last_partial_samples = 0
+
+        text = (await self.transcribe(audio, True)).strip()
+        if text:
+            self.texts.append(text)
+            await self.send({
+                "type": "final",
+                "segment": index,
+                "start": round(start / SAMPLE_RATE, 2),
+                "end": round((start + len(audio)) / SAMPLE_RATE, 2),
+                "text": text,
+            })
+
+    def _maybe_partial(self):
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        current = self.segmenter.current()
+        if current is None or len(current) - self._last_partial_samples < self.partial_interval:
+            return
+        self._last_partial_samples = len(current)
+        self._partial_task = asyncio.create_task(self._partial(self.segment_index, current))
+
+    async def _partial(self, index: int, audio: np.ndarray):
+        try:
+            text = (await self.transcribe(audio, False)).strip()
+        except Exception as e:
+            # I parziali sono facoltativi: un errore non interrompe lo stream
+            logger.warning(f"Trascrizione parziale non riuscita: {e}")
+            return
+        if text and index == self.segment_index:
+            await self.send({"type": "partial", "segment": index, "text": text})
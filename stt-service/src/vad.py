@@ -0,0 +1,109 @@
+"""Rilevamento dell'attività vocale (VAD) per la trascrizione in streaming.
+
+Il segmentatore lavora su frame da 30 ms a 16 kHz con una soglia di energia:
+costa pochi microsecondi per frame e può decidere incrementalmente, man mano
+che l'audio arriva, quando un segmento di parlato è concluso.
+"""
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def frame_dbfs(frames: np.ndarray) -> np.ndarray:
+    """Livello RMS in dBFS di ogni riga di `frames` (shape (n, frame_len))."""
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+class StreamingSegmenter:
+    """Divide un flusso audio float32 a 16 kHz in segmenti di parlato.
+
+    Un segmento si apre dopo `min_speech_ms` di frame sopra soglia e si chiude
+    dopo `min_silence_ms` di silenzio o al raggiungimento di `max_segment_seconds`.
+    Ogni segmento conserva `padding_ms` di audio prima e dopo il parlato.
+    """
+
+    def __init__(
+        self,
+        threshold_dbfs: float = -45.0,
+        frame_ms: int = 30,
+        min_speech_ms: int = 150,
+        min_silence_ms: int = 600,
+        max_segment_seconds: float = 20.0,
+        padding_ms: int = 200,
+        sample_rate: int = SAMPLE_RATE,
+    ):
+        self.threshold_dbfs = threshold_dbfs
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.max_segment_frames = max(1, int(max_segment_seconds * 1000) // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pre: deque = deque(maxlen=self.padding_frames + self.min_speech_frames)
+        self._segment: List[np.ndarray] = []
+        self._segment_start = 0
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self.processed_frames = 0
+
+    def push(self, samples: np.ndarray) -> List[Tuple[int, np.ndarray]]:
+        """Aggiunge audio e restituisce i segmenti conclusi come (campione iniziale, audio)."""
+        buffer = np.concatenate([self._pending, np.asarray(samples, dtype=np.float32)])
+        n_frames = len(buffer) // self.frame_len
+        self._pending = buffer[n_frames * self.frame_len:]
+        if n_frames == 0:
+            return []
+
+        frames = buffer[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        is_speech = frame_dbfs(frames) > self.threshold_dbfs
+
+        finished = []
+        for frame, speech in zip(frames, is_speech):
+            self.processed_frames += 1
+            if not self._in_speech:
+                self._pre.append(frame)
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.min_speech_frames:
+                    self._in_speech = True
+                    self._segment = list(self._pre)
+                    self._segment_start = (self.processed_frames - len(self._pre)) * self.frame_len
+                    self._pre.clear()
+                    self._silence_run = 0
+                continue
+
+            self._segment.append(frame)
+            self._silence_run = 0 if speech else self._silence_run + 1
+            if self._silence_run >= self.min_silence_frames or len(self._segment) >= self.max_segment_frames:
+                finished.append(self._close())
+        return finished
+
+    def current(self) -> Optional[np.ndarray]:
+        """Audio del segmento ancora aperto, se presente."""
+        if not self._in_speech:
+            return None
+        return np.concatenate(self._segment)
+
+    def flush(self) -> Optional[Tuple[int, np.ndarray]]:
+        """Chiude il segmento aperto a fine stream."""
+        if not self._in_speech:
+            return None
+        return self._close()
+
+    def _close(self) -> Tuple[int, np.ndarray]:
+        # Scarta il silenzio finale oltre il padding
+        trailing = self._silence_run - self.padding_frames
+        frames = self._segment[:-trailing] if trailing > 0 else self._segment
+        segment = (self._segment_start, np.concatenate(frames))
+
+        self._segment = []
+        self._in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        return segment
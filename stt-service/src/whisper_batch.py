@@ -0,0 +1,201 @@
+"""Trascrizione Whisper a batch per lo stt-service.
+
+`model.transcribe` elabora un file alla volta; qui ogni richiesta viene divisa
+in blocchi di parlato da al massimo 30 s (la finestra di Whisper) usando il VAD
+di faster-whisper, ogni blocco diventa un mel-spectrogram (n_mels, 3000) e più
+blocchi, anche di richieste diverse, vengono decodificati con una sola chiamata
+a `generate` di CTranslate2.
+
+Come in `model.transcribe`, i blocchi troppo ripetitivi o poco probabili vengono
+ridecodificati a temperature crescenti e quelli che il modello ritiene silenzio
+vengono scartati, così il rumore non produce testo inventato.
+"""
+import logging
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import ctranslate2
+import numpy as np
+from faster_whisper.feature_extractor import FeatureExtractor
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_compression_ratio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+CHUNK_SAMPLES = CHUNK_SECONDS * SAMPLE_RATE
+CHUNK_FRAMES = 3000
+# Lunghezza massima della sequenza di token generata dal decoder Whisper
+MAX_LENGTH = 448
+
+# Bande mel dei modelli Whisper fino a large-v2 (large-v3 ne usa 128)
+DEFAULT_N_MELS = 80
+# Ridecodifica a campionamento quando il risultato a temperatura 0 non supera i controlli
+FALLBACK_TEMPERATURES = (0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+@lru_cache(maxsize=None)
+def get_feature_extractor(n_mels: int = DEFAULT_N_MELS) -> FeatureExtractor:
+    """Un estrattore per numero di bande mel, creato alla prima richiesta."""
+    return FeatureExtractor(feature_size=n_mels)
+
+
+def split_speech(
+    audio: np.ndarray,
+    threshold: float = 0.5,
+    min_silence_ms: int = 500,
+    speech_pad_ms: int = 400,
+) -> List[np.ndarray]:
+    """Divide l'audio in blocchi contigui di parlato, ciascuno lungo al massimo 30 s.
+
+    Silenzio iniziale, finale e pause più lunghe di `min_silence_ms` vengono
+    scartati; i segmenti rilevati dal VAD vengono uniti finché l'intervallo coperto
+    resta entro la finestra di Whisper, così le pause brevi restano nel contesto.
+    """
+    options = VadOptions(
+        threshold=threshold,
+        min_silence_duration_ms=min_silence_ms,
+        speech_pad_ms=speech_pad_ms,
+        max_speech_duration_s=CHUNK_SECONDS - 1,
+    )
+    chunks = []
+    start = end = None
+    for speech in get_speech_timestamps(audio, options):
+        if start is not None and speech["end"] - start <= CHUNK_SAMPLES:
+            end = speech["end"]
+            continue
+        if start is not None:
+            chunks.append(audio[start:end])
+        start, end = speech["start"], speech["end"]
+    if start is not None:
+        chunks.append(audio[start:end])
+    return chunks
+
+
+def log_mel(audio: np.ndarray, n_mels: int = DEFAULT_N_MELS) -> np.ndarray:
+    """Mel-spectrogram (n_mels, 3000) di un blocco di al massimo 30 s, con padding di silenzio."""
+    mel = get_feature_extractor(n_mels)(audio[:CHUNK_SAMPLES])
+    mel = mel[:, :CHUNK_FRAMES]
+    if mel.shape[1] < CHUNK_FRAMES:
+        mel = np.pad(mel, ((0, 0), (0, CHUNK_FRAMES - mel.shape[1])))
+    return mel.astype(np.float32)
+
+
+class BatchedWhisper:
+    """Decodifica un batch di mel-spectrogram con il modello CTranslate2 sottostante.
+
+    Soglie e temperature hanno gli stessi valori predefiniti di `model.transcribe`.
+    """
+
+    def __init__(
+        self,
+        model,
+        language: str,
+        beam_size: int = 5,
+        best_of: int = 5,
+        temperatures: Sequence[float] = FALLBACK_TEMPERATURES,
+        compression_ratio_threshold: Optional[float] = 2.4,
+        log_prob_threshold: Optional[float] = -1.0,
+        no_speech_threshold: Optional[float] = 0.6,
+    ):
+        self.model = model
+        self.beam_size = beam_size
+        self.best_of = best_of
+        self.temperatures = tuple(temperatures)
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.log_prob_threshold = log_prob_threshold
+        self.no_speech_threshold = no_speech_threshold
+        # Bande mel attese dall'encoder: i mel vanno calcolati con questo valore
+        self.n_mels = getattr(model.model, "n_mels", DEFAULT_N_MELS)
+        self.tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language=language,
+        )
+        # Prompt fisso: lingua e task noti, nessun timestamp
+        self.prompt = list(self.tokenizer.sot_sequence) + [self.tokenizer.no_timestamps]
+
+        self.stats = {"fallbacks": 0, "no_speech_skipped": 0}
+
+    def __call__(self, mel_batch: np.ndarray) -> List[str]:
+        mel_batch = np.ascontiguousarray(mel_batch, dtype=np.float32)
+        results = self._generate(mel_batch, beam_size=self.beam_size)
+        no_speech = [result.no_speech_prob for result in results]
+        decoded = [self._decode(result) for result in results]
+        attempts = [[item] for item in decoded]
+
+        # Solo i blocchi che non superano i controlli vengono ridecodificati, insieme, a ogni temperatura
+        pending = [i for i, item in enumerate(decoded) if self._needs_fallback(item, no_speech[i])]
+        for temperature in self.temperatures:
+            if not pending:
+                break
+            self.stats["fallbacks"] += len(pending)
+            results = self._generate(
+                mel_batch[pending],
+                beam_size=1,
+                num_hypotheses=self.best_of,
+                sampling_topk=0,
+                sampling_temperature=temperature,
+            )
+            still_pending = []
+            for i, result in zip(pending, results):
+                item = self._decode(result)
+                attempts[i].append(item)
+                if self._needs_fallback(item, no_speech[i]):
+                    still_pending.append(i)
+                else:
+                    decoded[i] = item
+            pending = still_pending
+
+        failed = set(pending)
+        texts = []
+        for i, (text, avg_logprob, _) in enumerate(decoded):
+            if i in failed:
+                # Tutti i tentativi falliti: il più probabile tra quelli non ripetitivi, come model.transcribe
+                candidates = [item for item in attempts[i] if not self._too_repetitive(item)] or attempts[i]
+                text, avg_logprob, _ = max(candidates, key=lambda item: item[1])
+            if self._is_silence(avg_logprob, no_speech[i]):
+                self.stats["no_speech_skipped"] += 1
+                text = ""
+            texts.append(text)
+        return texts
+
+    def _generate(self, mel_batch: np.ndarray, **options):
+        return self.model.model.generate(
+            ctranslate2.StorageView.from_array(np.ascontiguousarray(mel_batch)),
+            [self.prompt] * len(mel_batch),
+            max_length=MAX_LENGTH,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+            **options,
+        )
+
+    def _decode(self, result) -> Tuple[str, float, float]:
+        """Risultato di generate -> (testo, log-probabilità media, rapporto di compressione)."""
+        eot = self.tokenizer.eot
+        tokens = [token for token in result.sequences_ids[0] if token < eot]
+        # Lo score è normalizzato sulla lunghezza (length_penalty 1): si ricava la media come in faster-whisper
+        avg_logprob = result.scores[0] * len(result.sequences_ids[0]) / (len(result.sequences_ids[0]) + 1)
+        text = self.tokenizer.decode(tokens).strip()
+        return text, avg_logprob, get_compression_ratio(text)
+
+    def _too_repetitive(self, item: Tuple[str, float, float]) -> bool:
+        return self.compression_ratio_threshold is not None and item[2] > self.compression_ratio_threshold
+
+    def _needs_fallback(self, item: Tuple[str, float, float], no_speech_prob: float) -> bool:
+        if self.no_speech_threshold is not None and no_speech_prob > self.no_speech_threshold:
+            # Probabile silenzio: verrà scartato, inutile ridecodificare
+            return False
+        low_logprob = self.log_prob_threshold is not None and item[1] < self.log_prob_threshold
+        return self._too_repetitive(item) or low_logprob
+
+    def _is_silence(self, avg_logprob: float, no_speech_prob: float) -> bool:
+        """Silenzio se il token <|nospeech|> è probabile e il testo non è abbastanza sicuro."""
+        if self.no_speech_threshold is None or no_speech_prob <= self.no_speech_threshold:
+            return False
+        return self.log_prob_threshold is None or avg_logprob <= self.log_prob_threshold
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 import os
-import uuid
+import asyncio
+import copy
+import json
+import time
 import torch
 import torchaudio
 import numpy as np
@@ -11,11 +14,47 @@ import uvicorn
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 import ChatTTS
+from worker import SynthesisWorker
+from cache import SynthesisCache, synthesis_key
+from formats import FORMATS, RangeNotSatisfiable, encode, file_chunks, negotiate, parse_range, variant_path
+from jobs import FAILED, JobStore
+from speakers import SpeakerCodec, SpeakerStore, StoreFull, parse_presets
+from streaming import split_sentences, synthesize_sentences, wav_header
 
 # Configurazione
 PORT = int(os.getenv("TTS_SERVICE_PORT", 5004))
 AUDIO_DIR = "audio_files"
 os.makedirs(AUDIO_DIR, exist_ok=True)
+# Raggruppamento dei testi in attesa in un'unica chiamata a infer
+TTS_BATCH_MAX_SIZE = int(os.getenv("TTS_BATCH_MAX_SIZE", 8))
+TTS_BATCH_MAX_WAIT_MS = float(os.getenv("TTS_BATCH_MAX_WAIT_MS", 50))
+SAMPLE_RATE = 24000
+# Budget su disco e scadenza (0 = mai) della cache delle sintesi in AUDIO_DIR
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", 512))
+TTS_CACHE_TTL_HOURS = float(os.getenv("TTS_CACHE_TTL_HOURS", 168))
+# Le entry usate negli ultimi secondi non vengono rimosse mentre una richiesta le sta servendo
+TTS_CACHE_GRACE_SECONDS = float(os.getenv("TTS_CACHE_GRACE_SECONDS", 60))
+# Permanenza in memoria dello stato dei job conclusi
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", 3600))
+# Intervallo dei messaggi di keep-alive sugli stream SSE
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+# Archivio persistente degli speaker: voci preimpostate "nome:seed" e capacità massima
+SPEAKER_DIR = os.getenv("SPEAKER_DIR", "speakers")
+SPEAKER_STORE_CAPACITY = int(os.getenv("SPEAKER_STORE_CAPACITY", 1024))
+SPEAKER_PRESETS = parse_presets(os.getenv("SPEAKER_PRESETS", "default:2222"))
+if not SPEAKER_PRESETS:
+    raise ValueError("SPEAKER_PRESETS deve contenere almeno una voce")
+# Voce usata dalle richieste senza speaker_id (la prima preimpostata se non indicata)
+DEFAULT_SPEAKER = os.getenv("TTS_DEFAULT_SPEAKER") or SPEAKER_PRESETS[0][0]
+if DEFAULT_SPEAKER not in {name for name, _ in SPEAKER_PRESETS}:
+    raise ValueError(f"TTS_DEFAULT_SPEAKER '{DEFAULT_SPEAKER}' non è tra le voci preimpostate")
+# Compilazione dei moduli del modello con torch.compile (avvio più lento, inferenza più veloce)
+TTS_COMPILE = os.getenv("TTS_COMPILE", "false").lower() == "true"
+# Sintesi di riscaldamento per ogni emozione prima di dichiarare il servizio pronto
+TTS_WARMUP = os.getenv("TTS_WARMUP", "true").lower() == "true"
+TTS_WARMUP_TEXT = os.getenv("TTS_WARMUP_TEXT", "Ciao, come stai?")
+# Durata massima del riscaldamento: scaduta, il servizio si dichiara pronto comunque (il gateway attende /health)
+TTS_WARMUP_TIMEOUT_SECONDS = float(os.getenv("TTS_WARMUP_TIMEOUT_SECONDS", 240))
 
 # Configurazione logging
 logging.basicConfig(
@@ -47,17 +86,15 @@ class TTSRequest(BaseModel):
 class TTSResponse(BaseModel):
     audio_id: str
     status: str = "success"
+    speaker_id: Optional[str] = None
 
 
 # Caricare il modello in memoria
 try:
     logger.info("Caricamento del modello ChatTTS...")
     chat_tts = ChatTTS.Chat()
-    chat_tts.load(compile=False)  # Utilizzo compile=False per compatibilità
-    logger.info("Modello ChatTTS caricato con successo")
-
-    # Memorizza gli speaker per riutilizzo
-    speaker_cache: Dict[str, np.ndarray] = {}
+    chat_tts.load(compile=TTS_COMPILE)
+    logger.info(f"Modello ChatTTS caricato con successo (compile={TTS_COMPILE})")
 
 except Exception as e:
     logger.error(f"Errore nel caricamento del modello ChatTTS: {e}")
@@ -74,132 +111,504 @@ emotion_to_params = {
 }
 
 
+def build_emotion_params(emotion_params: Dict) -> tuple:
+    """Parametri di ChatTTS di un'emozione: (InferCodeParams, RefineTextParams o None se senza prompt)."""
+    params_infer_code = ChatTTS.Chat.InferCodeParams(
+        temperature=emotion_params.get("temperature", 0.3),
+        top_P=emotion_params.get("top_P", 0.7),
+        top_K=emotion_params.get("top_K", 20),
+    )
+    params_refine_text = None
+    if emotion_params.get("prompt"):
+        params_refine_text = ChatTTS.Chat.RefineTextParams(prompt=emotion_params["prompt"])
+    return params_infer_code, params_refine_text
+
+
+# Oggetti dei parametri costruiti una volta sola all'avvio invece che a ogni job
+emotion_infer_params = {emotion: build_emotion_params(params) for emotion, params in emotion_to_params.items()}
+
+# Stato del riscaldamento: /health risponde 503 finché non è concluso
+warmup_state = {"ready": not TTS_WARMUP, "emotions": {}, "total_ms": None, "error": None}
+warmup_task: Optional[asyncio.Task] = None
+
+
+def require_ready():
+    """Modello non caricato -> 500; riscaldamento in corso -> 503 con Retry-After, senza accodare la richiesta."""
+    if chat_tts is None:
+        raise HTTPException(status_code=500, detail="Modello ChatTTS non disponibile")
+    if not warmup_state["ready"]:
+        raise HTTPException(
+            status_code=503,
+            detail="Servizio TTS in riscaldamento, riprovare tra poco",
+            headers={"Retry-After": "10"}
+        )
+
+
+def normalize_emotion(emotion: Optional[str]) -> str:
+    """Normalizza l'emozione e usa quella predefinita se non disponibile."""
+    emotion = emotion.lower() if emotion else "neutral"
+    if emotion not in emotion_to_params:
+        logger.warning(f"Emozione '{emotion}' non supportata, uso 'neutral'")
+        emotion = "neutral"
+    return emotion
+
+
+def synthesize_batch(texts: List[str], emotion: str, spk_emb=None) -> List[np.ndarray]:
+    """Sintetizza più testi con gli stessi parametri in una sola chiamata a `infer`.
+
+    Eseguita sul thread del worker; tutti i testi del gruppo condividono lo speaker.
+    """
+    shared_infer_code, params_refine_text = emotion_infer_params[emotion]
+
+    # Copia superficiale: l'oggetto precostruito resta senza speaker
+    params_infer_code = copy.copy(shared_infer_code)
+    if spk_emb is not None:
+        params_infer_code.spk_emb = spk_emb
+
+    if params_refine_text is not None:
+        return chat_tts.infer(texts, params_refine_text=params_refine_text, params_infer_code=params_infer_code)
+    return chat_tts.infer(texts, params_infer_code=params_infer_code)
+
+
+def save_wav(audio_path: str, wav: np.ndarray):
+    torchaudio.save(
+        audio_path,
+        torch.from_numpy(wav).unsqueeze(0) if wav.ndim == 1 else torch.from_numpy(wav),
+        SAMPLE_RATE
+    )
+
+
+def sample_speaker(seed: Optional[int] = None):
+    """Speaker casuale di ChatTTS; con `seed` è deterministico e lo stato globale del RNG resta invariato."""
+    if seed is None:
+        return chat_tts.sample_random_speaker()
+    with torch.random.fork_rng():
+        torch.manual_seed(seed)
+        return chat_tts.sample_random_speaker()
+
+
+def open_speaker_store() -> SpeakerStore:
+    """Apre l'archivio degli speaker e (ri)genera le voci preimpostate dai rispettivi seed."""
+    store = SpeakerStore(SPEAKER_DIR, speaker_codec.dim, SPEAKER_STORE_CAPACITY)
+    store.open()
+    for name, seed in SPEAKER_PRESETS:
+        store.add(speaker_codec.to_vector(sample_speaker(seed)), speaker_id=name, preset=True)
+    demoted = store.retain_presets({name for name, _ in SPEAKER_PRESETS})
+    if demoted:
+        logger.info(f"Voci non più preimpostate (ora rimovibili): {', '.join(demoted)}")
+    logger.info(f"Voci preimpostate: {', '.join(name for name, _ in SPEAKER_PRESETS)} (predefinita: {DEFAULT_SPEAKER})")
+    return store
+
+
+def resolve_speaker(speaker_id: Optional[str]):
+    """speaker_id richiesto, o la voce predefinita -> (speaker_id, embedding); 404 se non presente."""
+    speaker_id = speaker_id or DEFAULT_SPEAKER
+    vector = speaker_store.get(speaker_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail=f"Speaker '{speaker_id}' non trovato")
+    return speaker_id, speaker_codec.from_vector(vector)
+
+
+# Archivio degli speaker: un array float16 su disco e un indice degli id
+speaker_codec: Optional[SpeakerCodec] = None
+speaker_store: Optional[SpeakerStore] = None
+if chat_tts is not None:
+    speaker_codec = SpeakerCodec(chat_tts, sample_speaker(seed=0))
+    speaker_store = open_speaker_store()
+
+
+# Cache indirizzata per contenuto: richieste identiche condividono audio_id e file
+synthesis_cache = SynthesisCache(
+    AUDIO_DIR, int(TTS_CACHE_MAX_MB * 2**20), TTS_CACHE_TTL_HOURS * 3600, TTS_CACHE_GRACE_SECONDS
+)
+synthesis_cache.scan()
+
+# Stato dei job di sintesi (queued/running/done/failed) in memoria
+job_store = JobStore(JOB_TTL_SECONDS)
+
+# Worker di sintesi: i job compatibili vengono raggruppati e l'inferenza non blocca l'event loop
+tts_worker = SynthesisWorker(synthesize_batch, TTS_BATCH_MAX_SIZE, TTS_BATCH_MAX_WAIT_MS)
+
+
+async def warm_up():
+    """Una sintesi per emozione con la voce predefinita: inizializzazioni pigre e compilazione avvengono qui.
+
+    Passa dal worker come una richiesta reale; eventuali richieste arrivate nel
+    frattempo vengono accodate dietro il riscaldamento.
+    """
+    start = time.perf_counter()
+
+    async def run():
+        _, spk_emb = resolve_speaker(DEFAULT_SPEAKER)
+        for emotion in emotion_to_params:
+            emotion_start = time.perf_counter()
+            await tts_worker.submit(TTS_WARMUP_TEXT, emotion, DEFAULT_SPEAKER, spk_emb)
+            warmup_state["emotions"][emotion] = (time.perf_counter() - emotion_start) * 1000
+            logger.info(f"Riscaldamento '{emotion}' completato in {warmup_state['emotions'][emotion]:.0f} ms")
+
+    try:
+        await asyncio.wait_for(run(), timeout=TTS_WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        # Le emozioni mancanti pagheranno la latenza iniziale alla prima richiesta
+        logger.warning(f"Riscaldamento interrotto dopo {TTS_WARMUP_TIMEOUT_SECONDS:.0f} s")
+        warmup_state["error"] = f"Riscaldamento interrotto dopo {TTS_WARMUP_TIMEOUT_SECONDS:.0f} s"
+    except Exception as e:
+        # Il servizio resta utilizzabile: il riscaldamento serve solo a evitare la latenza iniziale
+        logger.error(f"Errore durante il riscaldamento del modello: {e}")
+        warmup_state["error"] = str(e)
+    warmup_state["total_ms"] = (time.perf_counter() - start) * 1000
+    warmup_state["ready"] = True
+    logger.info(f"Servizio TTS pronto (riscaldamento: {warmup_state['total_ms']:.0f} ms)")
+
+
+@app.on_event("startup")
+async def start_worker():
+    await tts_worker.start()
+    job_store.start()
+    if chat_tts is not None and TTS_WARMUP:
+        # In background: /health risponde 503 (e il gateway non parte) mentre il modello si riscalda
+        global warmup_task
+        warmup_task = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_worker():
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await tts_worker.stop()
+    await job_store.stop()
+    if speaker_store is not None:
+        speaker_store.flush()
+
+
 @app.get("/health")
 async def health_check():
     if chat_tts is None:
-        raise HTTPException(status_code=500, detail="Modello ChatTTS non caricato correttamente")
-    return {"status": "healthy"}
+        # Sano per Docker: un modello che non si carica non deve bloccare l'avvio del gateway
+        return {"status": "degraded", "detail": "Modello ChatTTS non caricato correttamente"}
+    if not warmup_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "warmed_emotions": list(warmup_state["emotions"])}
+        )
+    return {"status": "healthy", "compile": TTS_COMPILE}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Restituisce le metriche di worker di sintesi, cache, archivio speaker e riscaldamento."""
+    return {
+        "worker": tts_worker.stats(),
+        "cache": synthesis_cache.stats(),
+        "jobs": job_store.stats(),
+        "speakers": speaker_store.stats() if speaker_store is not None else None,
+        "warmup": warmup_state,
+    }
 
 
 @app.post("/synthesize", response_model=TTSResponse)
 async def synthesize_speech(request: TTSRequest, background_tasks: BackgroundTasks):
-    if chat_tts is None:
-        raise HTTPException(status_code=500, detail="Modello ChatTTS non disponibile")
+    require_ready()
 
     try:
-        # Generare un ID univoco per il file audio
-        audio_id = str(uuid.uuid4())
+        emotion = normalize_emotion(request.emotion)
+        speaker_id, spk_emb = resolve_speaker(request.speaker_id)
+
+        # L'ID del file audio è l'hash del contenuto: testo, parametri dell'emozione e speaker
+        audio_id = synthesis_key(request.text, emotion_to_params[emotion], spk_emb)
+        cached = synthesis_cache.lookup(audio_id, in_flight=job_store.is_active(audio_id))
+        if cached == "hit":
+            return {"audio_id": audio_id, "status": "success", "speaker_id": speaker_id}
+        if cached == "in_flight":
+            # Una sintesi identica è già in corso: il client attende lo stesso audio_id
+            return {"audio_id": audio_id, "status": "processing", "speaker_id": speaker_id}
 
         # Aggiungere il task di sintesi in background
+        job_store.create(audio_id)
         background_tasks.add_task(
             generate_audio,
             request.text,
             audio_id,
-            request.emotion,
-            request.speaker_id
+            emotion,
+            speaker_id,
+            spk_emb
         )
 
-        return {"audio_id": audio_id, "status": "processing"}
+        return {"audio_id": audio_id, "status": "processing", "speaker_id": speaker_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Errore durante la sintesi vocale: {e}")
         raise HTTPException(status_code=500, detail=f"Errore durante la sintesi vocale: {str(e)}")
 
 
+@app.post("/synthesize/stream")
+async def synthesize_stream(request: TTSRequest):
+    """Sintesi frase per frase restituita come WAV PCM 16 bit a lunghezza indefinita (chunked)."""
+    require_ready()
+
+    sentences = split_sentences(request.text)
+    if not sentences:
+        raise HTTPException(status_code=400, detail="Testo vuoto")
+
+    emotion = normalize_emotion(request.emotion)
+    speaker_id, spk_emb = resolve_speaker(request.speaker_id)
+
+    async def audio_stream():
+        yield wav_header(SAMPLE_RATE)
+        try:
+            async for index, _, pcm in synthesize_sentences(tts_worker, sentences, emotion, speaker_id, spk_emb):
+                logger.info(f"Frase {index + 1}/{len(sentences)} inviata in streaming")
+                yield pcm
+        except Exception as e:
+            # Lo stato HTTP è già stato inviato: lo stream viene solo interrotto
+            logger.error(f"Errore durante la sintesi in streaming: {e}")
+
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/wav",
+        headers={"X-Speaker-Id": speaker_id, "X-Sentence-Count": str(len(sentences))}
+    )
+
+
+@app.websocket("/ws/synthesize")
+async def synthesize_websocket(websocket: WebSocket):
+    """Sintesi in streaming via WebSocket.
+
+    Il client invia `{"text": ..., "emotion": ..., "speaker_id": ...}`; il server
+    risponde con `start`, poi per ogni frase un messaggio `chunk` seguito da un
+    frame binario PCM 16 bit mono a 24 kHz, infine `done`. La connessione può
+    essere riutilizzata per più richieste.
+    """
+    await websocket.accept()
+    if chat_tts is None:
+        await websocket.send_json({"type": "error", "detail": "Modello ChatTTS non disponibile"})
+        await websocket.close(code=1011)
+        return
+
+    try:
+        while True:
+            request = TTSRequest(**await websocket.receive_json())
+            if not warmup_state["ready"]:
+                await websocket.send_json({"type": "error", "detail": "Servizio TTS in riscaldamento, riprovare tra poco"})
+                continue
+            sentences = split_sentences(request.text)
+            emotion = normalize_emotion(request.emotion)
+            try:
+                speaker_id, spk_emb = resolve_speaker(request.speaker_id)
+            except HTTPException as e:
+                # Speaker sconosciuto: la connessione resta aperta per le richieste successive
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+
+            await websocket.send_json({
+                "type": "start",
+                "format": "pcm16",
+                "sample_rate": SAMPLE_RATE,
+                "sentences": len(sentences),
+                "speaker_id": speaker_id
+            })
+            async for index, sentence, pcm in synthesize_sentences(
+                tts_worker, sentences, emotion, speaker_id, spk_emb
+            ):
+                await websocket.send_json({"type": "chunk", "index": index, "text": sentence, "bytes": len(pcm)})
+                await websocket.send_bytes(pcm)
+            await websocket.send_json({"type": "done"})
+
+    except WebSocketDisconnect:
+        logger.info("Client disconnesso durante la sintesi in streaming")
+    except Exception as e:
+        logger.error(f"Errore durante la sintesi in streaming: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            # Connessione già chiusa dal client
+            pass
+
+
+# Codifiche in corso: richieste concorrenti dello stesso formato attendono la stessa codifica
+encodings: Dict[str, asyncio.Future] = {}
+
+
+async def audio_variant(audio_id: str, fmt: str) -> str:
+    """Percorso del file nel formato richiesto, codificandolo dal WAV solo la prima volta."""
+    wav_path = os.path.join(AUDIO_DIR, f"{audio_id}.wav")
+    path = variant_path(AUDIO_DIR, audio_id, fmt)
+    if os.path.exists(path):
+        return path
+
+    key = f"{audio_id}.{fmt}"
+    pending = encodings.get(key)
+    if pending is not None:
+        await asyncio.shield(pending)
+        return path
+
+    pending = asyncio.get_running_loop().run_in_executor(None, encode, wav_path, path, fmt)
+    encodings[key] = pending
+    try:
+        await asyncio.shield(pending)
+        # La variante conta nel budget su disco della stessa entry della cache
+        synthesis_cache.add(audio_id)
+        logger.info(f"Audio {audio_id} codificato in {fmt} ({os.path.getsize(path)} byte)")
+    finally:
+        encodings.pop(key, None)
+    return path
+
+
 @app.get("/audio/{audio_id}")
-async def get_audio(audio_id: str):
-    audio_path = os.path.join(AUDIO_DIR, f"{audio_id}.wav")
+async def get_audio(audio_id: str, request: Request, audio_format: Optional[str] = Query(None, alias="format")):
+    """Audio nel formato negoziato (`?format=` o header Accept), con supporto alle richieste Range."""
+    job = job_store.get(audio_id)
+    if job is not None and not job.finished:
+        return {"status": "processing", "state": job.state}
+    if job is not None and job.state == FAILED:
+        return JSONResponse(status_code=500, content={"status": "error", "detail": job.error})
 
-    if not os.path.exists(audio_path):
-        # Controlla se è ancora in elaborazione
-        processing_path = os.path.join(AUDIO_DIR, f"{audio_id}.processing")
-        if os.path.exists(processing_path):
-            return {"status": "processing"}
-        else:
-            raise HTTPException(status_code=404, detail="Audio non trovato")
+    try:
+        fmt = negotiate(audio_format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return FileResponse(audio_path, media_type="audio/wav")
+    # Accesso registrato prima della verifica: per `grace_seconds` la cache non rimuove i file dell'entry
+    synthesis_cache.touch(audio_id)
+    if not os.path.exists(os.path.join(AUDIO_DIR, f"{audio_id}.wav")):
+        raise HTTPException(status_code=404, detail="Audio non trovato")
 
+    try:
+        audio_path = await audio_variant(audio_id, fmt)
+    except Exception as e:
+        logger.error(f"Errore durante la codifica dell'audio {audio_id} in {fmt}: {e}")
+        raise HTTPException(status_code=500, detail=f"Errore durante la codifica dell'audio: {str(e)}")
+    # La codifica può essere durata a lungo: la finestra di protezione riparte da qui
+    synthesis_cache.touch(audio_id)
 
-async def generate_audio(text: str, audio_id: str, emotion: str = "neutral", speaker_id: str = None):
-    """Genera l'audio in background e salva il file."""
+    media_type = FORMATS[fmt][1]
+    size = os.path.getsize(audio_path)
+    headers = {"Accept-Ranges": "bytes", "Vary": "Accept"}
+
+    range_header = request.headers.get("range")
+    try:
+        byte_range = parse_range(range_header, size) if range_header else None
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileResponse(audio_path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    return StreamingResponse(
+        file_chunks(audio_path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)}
+    )
+
+
+def job_status(audio_id: str):
+    """Stato del job; senza job registrato l'audio è pronto se è presente in cache."""
+    job = job_store.get(audio_id)
+    if job is not None:
+        return job.to_dict()
+    if audio_id in synthesis_cache.entries:
+        return {"audio_id": audio_id, "status": "done"}
+    return None
+
+
+@app.get("/audio/{audio_id}/wait")
+async def wait_audio(audio_id: str, timeout: float = Query(25.0, ge=0, le=120)):
+    """Long-poll: risponde appena il job si conclude, o allo scadere di `timeout` secondi."""
+    await job_store.wait(audio_id, timeout)
+    status = job_status(audio_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Audio non trovato")
+    return status
+
+
+@app.get("/audio/{audio_id}/events")
+async def audio_events(audio_id: str):
+    """Server-sent events: un evento `state` a ogni cambio di stato, fino a done o failed."""
+    if job_status(audio_id) is None:
+        raise HTTPException(status_code=404, detail="Audio non trovato")
+
+    async def event_stream():
+        while True:
+            status = job_status(audio_id)
+            if status is None:
+                return
+            yield f"event: state\ndata: {json.dumps(status)}\n\n"
+            if status["status"] in ("done", "failed"):
+                return
+
+            job = job_store.get(audio_id)
+            if job is None:
+                return
+            while not await job.wait_change(SSE_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def generate_audio(text: str, audio_id: str, emotion: str = "neutral", speaker_id: str = None, spk_emb=None):
+    """Accoda la sintesi al worker e salva il file, aggiornando lo stato del job."""
     try:
-        # Crea un file di segnalazione per indicare che l'elaborazione è in corso
-        processing_path = os.path.join(AUDIO_DIR, f"{audio_id}.processing")
-        with open(processing_path, "w") as f:
-            f.write("processing")
-
-        # Normalizza l'emozione e usa quella predefinita se non disponibile
-        emotion = emotion.lower() if emotion else "neutral"
-        if emotion not in emotion_to_params:
-            logger.warning(f"Emozione '{emotion}' non supportata, uso 'neutral'")
-            emotion = "neutral"
-
-        # Configura i parametri in base all'emozione
-        emotion_params = emotion_to_params.get(emotion)
-
-        params_infer_code = ChatTTS.Chat.InferCodeParams(
-            temperature=emotion_params.get("temperature", 0.3),
-            top_P=emotion_params.get("top_P", 0.7),
-            top_K=emotion_params.get("top_K", 20),
+        wav = await tts_worker.submit(
+            text, emotion, speaker_id, spk_emb,
+            on_start=lambda: job_store.mark_running(audio_id)
         )
 
-        # Se è stato specificato uno speaker_id, usa quello
-        if speaker_id and speaker_id in speaker_cache:
-            params_infer_code.spk_emb = speaker_cache[speaker_id]
-        elif not speaker_id:
-            # Genera un nuovo speaker e memorizzalo
-            new_speaker = chat_tts.sample_random_speaker()
-            speaker_id = str(uuid.uuid4())
-            speaker_cache[speaker_id] = new_speaker
-            params_infer_code.spk_emb = new_speaker
-
-        # Inizializza params_refine_text solo se c'è un prompt
-        params_refine_text = None
-        if emotion_params.get("prompt"):
-            params_refine_text = ChatTTS.Chat.RefineTextParams(
-                prompt=emotion_params["prompt"]
-            )
-
-        # Genera l'audio con params_refine_text solo se non è None
-        if params_refine_text:
-            wavs = chat_tts.infer(
-                [text],
-                params_refine_text=params_refine_text,
-                params_infer_code=params_infer_code
-            )
-        else:
-            wavs = chat_tts.infer(
-                [text],
-                params_infer_code=params_infer_code
-            )
-
         # Salva il file audio
         audio_path = os.path.join(AUDIO_DIR, f"{audio_id}.wav")
-        torchaudio.save(
-            audio_path,
-            torch.from_numpy(wavs[0]).unsqueeze(0) if wavs[0].ndim == 1 else torch.from_numpy(wavs[0]),
-            24000
-        )
-
-        # Rimuovi il file di segnalazione
-        if os.path.exists(processing_path):
-            os.remove(processing_path)
+        await asyncio.get_running_loop().run_in_executor(None, save_wav, audio_path, wav)
+        synthesis_cache.add(audio_id)
+        job_store.mark_done(audio_id)
 
         logger.info(f"Audio generato con successo: {audio_id}")
 
     except Exception as e:
         logger.error(f"Errore durante la generazione dell'audio {audio_id}: {e}")
-        # Rimuovi il file di segnalazione in caso di errore
-        if os.path.exists(processing_path):
-            os.remove(processing_path)
+        job_store.mark_failed(audio_id, str(e))
+
 
 @app.get("/speakers")
 async def get_speakers():
-    speakers = list(speaker_cache.keys())
-    return {"speakers": speakers, "count": len(speakers)}
+    if speaker_store is None:
+        raise HTTPException(status_code=500, detail="Modello ChatTTS non disponibile")
+    speakers = speaker_store.list()
+    return {"speakers": speakers, "count": len(speakers), "default": DEFAULT_SPEAKER}
+
+
+@app.post("/speakers")
+async def create_speaker():
+    """Estrae un nuovo speaker casuale e lo memorizza; lo speaker_id resta valido dopo un riavvio."""
+    if speaker_store is None:
+        raise HTTPException(status_code=500, detail="Modello ChatTTS non disponibile")
+    spk_emb = await asyncio.get_running_loop().run_in_executor(None, chat_tts.sample_random_speaker)
+    try:
+        speaker_id = speaker_store.add(speaker_codec.to_vector(spk_emb))
+    except StoreFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"speaker_id": speaker_id}
+
+
+@app.delete("/speakers/{speaker_id}")
+async def delete_speaker(speaker_id: str):
+    if speaker_store is None:
+        raise HTTPException(status_code=500, detail="Modello ChatTTS non disponibile")
+    entry = speaker_store.index.get(speaker_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Speaker '{speaker_id}' non trovato")
+    if entry["preset"]:
+        raise HTTPException(status_code=400, detail="Le voci preimpostate non possono essere rimosse")
+    speaker_store.remove(speaker_id)
+    return {"speaker_id": speaker_id, "status": "deleted"}
 
 
 if __name__ == "__main__":
     print(f"Avvio del servizio TTS sulla porta {PORT}")
-    uvicorn.run("app:app", host="0.0.0.0", port=PORT, reload=True)
\ No newline at end of file
+    # Senza reload: in produzione il servizio si avvia con `uvicorn app:app --app-dir src` (vedi Dockerfile)
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
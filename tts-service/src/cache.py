@@ -0,0 +1,177 @@
+"""Cache delle sintesi indirizzata per contenuto.
+
+L'`audio_id` è l'hash di testo normalizzato, parametri dell'emozione ed
+embedding dello speaker: richieste identiche producono lo stesso id, quindi lo
+stesso file in `AUDIO_DIR`. I file vengono rimossi dal meno usato di recente
+quando si supera il budget su disco, o dopo `ttl_seconds` senza accessi.
+Le entry usate negli ultimi `grace_seconds` non vengono mai rimosse: una
+richiesta che ha appena verificato l'esistenza del file riesce ad aprirlo (una
+volta aperto, su POSIX, resta leggibile anche se rimosso).
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Forma Unicode NFC e spazi compattati: varianti solo tipografiche condividono la cache."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def speaker_bytes(spk_emb: Any) -> bytes:
+    """Rappresentazione stabile dell'embedding (stringa codificata, array NumPy o tensore)."""
+    if spk_emb is None:
+        return b"random"
+    if isinstance(spk_emb, str):
+        return spk_emb.encode("utf-8")
+    if hasattr(spk_emb, "detach"):
+        spk_emb = spk_emb.detach().cpu().numpy()
+    return np.ascontiguousarray(spk_emb).tobytes()
+
+
+def synthesis_key(text: str, emotion_params: Dict[str, Any], spk_emb: Any) -> str:
+    digest = hashlib.sha256()
+    digest.update(normalize_text(text).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(emotion_params, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(speaker_bytes(spk_emb))
+    return digest.hexdigest()[:32]
+
+
+class SynthesisCache:
+    """Indice LRU dei file audio in `audio_dir`, con budget su disco e TTL sull'ultimo accesso."""
+
+    def __init__(self, audio_dir: str, max_bytes: int, ttl_seconds: float = 0.0, grace_seconds: float = 60.0):
+        self.audio_dir = audio_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        # audio_id -> {"size": byte totali dei file, "last_access": timestamp}
+        self.entries: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.protected_skips = 0
+
+    def scan(self):
+        """Ricostruisce l'indice dai file già presenti (ordine LRU dalla data di modifica)."""
+        files = []
+        for path in glob.glob(os.path.join(self.audio_dir, "*.wav")):
+            stat = os.stat(path)
+            files.append((stat.st_mtime, os.path.splitext(os.path.basename(path))[0]))
+        for mtime, audio_id in sorted(files):
+            self.add(audio_id, last_access=mtime)
+        self._enforce_limits()
+        logger.info(f"Cache sintesi: {len(self.entries)} file, {self.total_bytes / 2**20:.1f} MB")
+
+    def lookup(self, audio_id: str, in_flight: bool = False) -> Optional[str]:
+        """Restituisce "hit", "in_flight" oppure None (da sintetizzare) e aggiorna le statistiche.
+
+        `in_flight` indica se un job con lo stesso id è già in coda o in esecuzione.
+        """
+        self._expire()
+        if audio_id in self.entries:
+            self.hits += 1
+            self.touch(audio_id)
+            return "hit"
+        if in_flight:
+            self.coalesced += 1
+            return "in_flight"
+        self.misses += 1
+        return None
+
+    def touch(self, audio_id: str):
+        entry = self.entries.get(audio_id)
+        if entry is not None:
+            entry["last_access"] = time.time()
+            self.entries.move_to_end(audio_id)
+
+    def add(self, audio_id: str, last_access: Optional[float] = None):
+        """Registra (o aggiorna) tutti i file `<audio_id>.*` dell'entry e applica il budget."""
+        size = sum(os.path.getsize(path) for path in self._files(audio_id))
+        previous = self.entries.pop(audio_id, None)
+        if previous is not None:
+            self.total_bytes -= previous["size"]
+        self.entries[audio_id] = {"size": size, "last_access": last_access or time.time()}
+        self.total_bytes += size
+        if last_access is None:
+            self._enforce_limits()
+
+    def _files(self, audio_id: str):
+        return [
+            path for path in glob.glob(os.path.join(self.audio_dir, f"{audio_id}.*"))
+            # File temporanei di una codifica in corso
+            if not path.endswith(".tmp")
+        ]
+
+    def _remove(self, audio_id: str):
+        entry = self.entries.pop(audio_id)
+        self.total_bytes -= entry["size"]
+        for path in self._files(audio_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _protected(self, entry: Dict[str, float], now: float) -> bool:
+        """Entry usata da poco: potrebbe essere in corso di lettura o di codifica."""
+        return now - entry["last_access"] < self.grace_seconds
+
+    def _expire(self):
+        if self.ttl_seconds <= 0:
+            return
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        # In ordine LRU le entry scadute sono tutte in testa
+        for audio_id, entry in list(self.entries.items()):
+            if entry["last_access"] >= cutoff:
+                break
+            if self._protected(entry, now):
+                continue
+            self._remove(audio_id)
+            self.expirations += 1
+
+    def _enforce_limits(self):
+        self._expire()
+        now = time.time()
+        for audio_id, entry in list(self.entries.items()):
+            if self.total_bytes <= self.max_bytes or len(self.entries) <= 1:
+                break
+            if self._protected(entry, now):
+                # Budget superato temporaneamente: l'entry verrà rimossa quando non sarà più in uso
+                self.protected_skips += 1
+                continue
+            self._remove(audio_id)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "grace_seconds": self.grace_seconds,
+            "protected_skips": self.protected_skips,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
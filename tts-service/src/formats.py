@@ -0,0 +1,130 @@
+"""Formati di uscita dell'audio sintetizzato e richieste HTTP Range.
+
+Il WAV PCM a 24 kHz scritto dopo la sintesi resta il file di riferimento; le
+varianti compresse (Opus/OGG, MP3, FLAC) vengono codificate con ffmpeg alla
+prima richiesta e salvate accanto come `<audio_id>.<estensione>`, così le
+richieste successive servono direttamente il file già codificato.
+"""
+import os
+import re
+import subprocess
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# formato -> (estensione, media type, muxer ffmpeg, argomenti del codificatore)
+FORMATS: Dict[str, Tuple[str, str, str, List[str]]] = {
+    "wav": ("wav", "audio/wav", "wav", []),
+    "opus": ("ogg", "audio/ogg", "ogg", ["-c:a", "libopus", "-b:a", "32k", "-application", "voip"]),
+    "mp3": ("mp3", "audio/mpeg", "mp3", ["-c:a", "libmp3lame", "-b:a", "64k"]),
+    "flac": ("flac", "audio/flac", "flac", ["-c:a", "flac"]),
+}
+
+# Media type dell'header Accept -> formato
+MEDIA_TYPES = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+}
+
+DEFAULT_FORMAT = "wav"
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def negotiate(format_param: Optional[str], accept: Optional[str]) -> str:
+    """Formato richiesto: il parametro esplicito ha la precedenza, poi l'header Accept (con i pesi q).
+
+    Solo i media type audio elencati esplicitamente contano: `*/*` e `audio/*`
+    (inviati dai browser per i tag <audio>) restituiscono il WAV.
+    """
+    if format_param:
+        format_param = format_param.lower()
+        if format_param not in FORMATS:
+            raise ValueError(f"Formato '{format_param}' non supportato (disponibili: {', '.join(FORMATS)})")
+        return format_param
+
+    best, best_q = DEFAULT_FORMAT, 0.0
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        fmt = MEDIA_TYPES.get(media_type.lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        # A parità di peso vince il primo elencato
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def variant_path(audio_dir: str, audio_id: str, fmt: str) -> str:
+    return os.path.join(audio_dir, f"{audio_id}.{FORMATS[fmt][0]}")
+
+
+def encode(wav_path: str, out_path: str, fmt: str):
+    """Codifica il WAV nel formato richiesto con ffmpeg; il file compare solo a codifica completata."""
+    tmp_path = out_path + ".tmp"
+    _, _, muxer, codec_args = FORMATS[fmt]
+    command = [
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", wav_path, *codec_args, "-f", muxer, tmp_path,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=120)
+        if result.returncode != 0:
+            stderr = result.stderr.decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg non è riuscito a codificare in {fmt}: {stderr}")
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Header `Range: bytes=start-end` -> (start, end) inclusivi; None se non interpretabile (file intero).
+
+    Sono supportati un singolo intervallo e la forma `bytes=-N` (ultimi N byte).
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def file_chunks(path: str, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Legge i byte [start, end] del file a blocchi."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
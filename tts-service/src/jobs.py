@@ -0,0 +1,148 @@
+"""Tabella in memoria dei job di sintesi.
+
+Sostituisce i file `<id>.processing`: ogni job passa per gli stati
+queued -> running -> done | failed, con i tempi di ogni fase. I client possono
+attendere il cambio di stato (long-poll o SSE) invece di interrogare il
+filesystem; i job conclusi vengono rimossi dopo `ttl_seconds`.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TERMINAL_STATES = (DONE, FAILED)
+
+
+class Job:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    def _set_state(self, state: str):
+        self.state = state
+        # Sveglia chi attende e prepara un nuovo evento per il cambio successivo
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_change(self, timeout: float) -> bool:
+        """Attende il prossimo cambio di stato; False se scade il timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        def ms(start, end):
+            return (end - start) * 1000 if start is not None and end is not None else None
+
+        return {
+            "audio_id": self.id,
+            "status": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "queued_ms": ms(self.created_at, self.started_at),
+            "synthesis_ms": ms(self.started_at, self.finished_at),
+            "total_ms": ms(self.created_at, self.finished_at),
+        }
+
+
+class JobStore:
+    def __init__(self, ttl_seconds: float = 3600.0):
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._cleaner: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed = 0
+
+    def create(self, job_id: str) -> Job:
+        job = Job(job_id)
+        self.jobs[job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def is_active(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        return job is not None and not job.finished
+
+    def mark_running(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is not None and job.state == QUEUED:
+            job.started_at = time.time()
+            job._set_state(RUNNING)
+
+    def mark_done(self, job_id: str):
+        job = self.jobs[job_id]
+        job.finished_at = time.time()
+        if job.started_at is None:
+            job.started_at = job.finished_at
+        self.completed += 1
+        job._set_state(DONE)
+
+    def mark_failed(self, job_id: str, error: str):
+        job = self.jobs[job_id]
+        job.finished_at = time.time()
+        job.error = error
+        self.failed += 1
+        job._set_state(FAILED)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Long-poll: restituisce il job appena concluso o allo scadere del timeout."""
+        job = self.jobs.get(job_id)
+        deadline = time.monotonic() + timeout
+        while job is not None and not job.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await job.wait_change(remaining):
+                break
+        return job
+
+    def cleanup(self) -> int:
+        """Rimuove i job conclusi da più di `ttl_seconds`."""
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return len(expired)
+
+    async def _clean_periodically(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.ttl_seconds / 10))
+            removed = self.cleanup()
+            if removed:
+                logger.info(f"Rimossi {removed} job di sintesi scaduti")
+
+    def start(self):
+        if self._cleaner is None:
+            self._cleaner = asyncio.create_task(self._clean_periodically())
+
+    async def stop(self):
+        if self._cleaner is not None:
+            self._cleaner.cancel()
+            try:
+                await self._cleaner
+            except asyncio.CancelledError:
+                pass
+            self._cleaner = None
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self.jobs.values():
+            states[job.state] += 1
+        return {"tracked": len(self.jobs), "states": states, "completed": self.completed, "failed": self.failed}
@@ -0,0 +1,272 @@
+"""Archivio persistente degli embedding degli speaker.
+
+Gli embedding sono righe float16 di un unico array memory-mapped
+(`embeddings.f16`, forma (capacity, dim)); `index.json` associa ogni
+speaker_id alla sua riga. Lookup e inserimento sono O(1), la memoria resta
+costante e gli id restano validi dopo un riavvio. Gli speaker preimpostati
+(voci con nome) non vengono mai rimossi; gli altri vengono eliminati dal meno
+usato di recente quando l'archivio è pieno.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.f16"
+INDEX_FILE = "index.json"
+
+
+def parse_presets(value: str) -> List[Tuple[str, int]]:
+    """`"default:2222,calma:1234"` -> [("default", 2222), ("calma", 1234)]."""
+    presets = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, seed = item.partition(":")
+        if not sep or not name.strip() or not seed.strip().isdigit():
+            raise ValueError(f"Voce preimpostata non valida: '{item}' (atteso nome:seed)")
+        presets.append((name.strip(), int(seed)))
+    return presets
+
+
+class SpeakerCodec:
+    """Conversione tra gli embedding di ChatTTS e i vettori float16 dell'archivio.
+
+    Le versioni recenti di ChatTTS (0.2+) scambiano gli embedding come stringhe
+    compresse, codificate dai metodi privati `Speaker._encode/_decode`; le
+    precedenti usano direttamente tensori. È l'unico punto che usa quell'API
+    privata: la disponibilità viene verificata all'avvio con un round-trip, così
+    un cambiamento di ChatTTS fa fallire l'avvio invece delle singole richieste.
+    """
+
+    def __init__(self, chat, sample):
+        self.as_string = isinstance(sample, str)
+        speaker = getattr(chat, "speaker", None)
+        self._decode = getattr(speaker, "_decode", None)
+        self._encode = getattr(speaker, "_encode", None)
+        if self.as_string:
+            if not (callable(self._decode) and callable(self._encode)):
+                raise RuntimeError(
+                    "Versione di ChatTTS non supportata: embedding come stringhe senza Speaker._encode/_decode"
+                )
+            vector = self.to_vector(sample)
+            if not np.array_equal(self.to_vector(self.from_vector(vector)), vector):
+                raise RuntimeError("Versione di ChatTTS non supportata: codifica degli embedding non reversibile")
+        self.dim = len(self.to_vector(sample))
+
+    def to_vector(self, spk_emb) -> np.ndarray:
+        """Embedding di ChatTTS (stringa o tensore) -> vettore float16."""
+        if isinstance(spk_emb, str):
+            return np.asarray(self._decode(spk_emb), dtype=np.float16).reshape(-1)
+        if hasattr(spk_emb, "detach"):
+            spk_emb = spk_emb.detach().cpu().numpy()
+        return np.asarray(spk_emb, dtype=np.float16).reshape(-1)
+
+    def from_vector(self, vector: np.ndarray):
+        """Vettore float16 -> formato atteso da `InferCodeParams.spk_emb`."""
+        import torch
+
+        if self.as_string:
+            return self._encode(torch.from_numpy(np.asarray(vector, dtype=np.float16)))
+        return torch.from_numpy(vector.astype(np.float32))
+
+
+class StoreFull(Exception):
+    """Tutte le righe sono occupate da voci preimpostate: nessuno speaker può essere rimosso."""
+
+
+class SpeakerStore:
+    def __init__(self, directory: str, dim: int, capacity: int = 1024):
+        if capacity < 1:
+            raise ValueError("La capacità dell'archivio speaker deve essere positiva")
+        self.directory = directory
+        self.dim = dim
+        self.capacity = capacity
+        # speaker_id -> {"row", "preset", "created_at", "last_used"}, in ordine LRU
+        self.index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.free_rows: List[int] = []
+        self.embeddings: Optional[np.memmap] = None
+        self._dirty = False
+
+        self.lookups = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def embeddings_path(self) -> str:
+        return os.path.join(self.directory, EMBEDDINGS_FILE)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def open(self):
+        """Apre (o crea) l'archivio su disco; se dim o capacità sono cambiate le righe vengono ricopiate."""
+        os.makedirs(self.directory, exist_ok=True)
+        saved = None
+        if os.path.exists(self.index_path) and os.path.exists(self.embeddings_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+
+        if saved is not None and saved.get("dim") != self.dim:
+            logger.warning(
+                f"Dimensione degli embedding cambiata ({saved.get('dim')} -> {self.dim}): archivio speaker azzerato"
+            )
+            saved = None
+
+        if saved is not None and saved["capacity"] == self.capacity:
+            self.embeddings = np.memmap(self.embeddings_path, dtype=np.float16, mode="r+",
+                                        shape=(self.capacity, self.dim))
+            for speaker_id, entry in saved["speakers"]:
+                self.index[speaker_id] = entry
+        else:
+            self._rebuild(saved)
+
+        used = {entry["row"] for entry in self.index.values()}
+        self.free_rows = [row for row in range(self.capacity - 1, -1, -1) if row not in used]
+        logger.info(f"Archivio speaker: {len(self.index)}/{self.capacity} speaker in {self.directory}")
+
+    def _rebuild(self, saved: Optional[Dict[str, Any]]):
+        """Crea un nuovo file con la capacità attuale, copiando gli speaker più recenti che vi rientrano."""
+        rows: List[Tuple[str, Dict[str, Any], np.ndarray]] = []
+        if saved is not None:
+            old = np.memmap(self.embeddings_path, dtype=np.float16, mode="r",
+                            shape=(saved["capacity"], self.dim))
+            speakers = saved["speakers"]
+            # Le voci preimpostate hanno la precedenza, poi dal più recente al meno recente
+            keep = [item for item in speakers if item[1]["preset"]]
+            keep += [item for item in reversed(speakers) if not item[1]["preset"]]
+            keep = keep[:self.capacity]
+            kept_ids = {speaker_id for speaker_id, _ in keep}
+            rows = [(speaker_id, entry, np.array(old[entry["row"]]))
+                    for speaker_id, entry in speakers if speaker_id in kept_ids]
+            self.evictions += len(speakers) - len(rows)
+            del old
+            logger.info(f"Capacità dell'archivio speaker cambiata ({saved['capacity']} -> {self.capacity})")
+
+        tmp_path = self.embeddings_path + ".tmp"
+        embeddings = np.memmap(tmp_path, dtype=np.float16, mode="w+", shape=(self.capacity, self.dim))
+        for row, (speaker_id, entry, vector) in enumerate(rows):
+            embeddings[row] = vector
+            self.index[speaker_id] = {**entry, "row": row}
+        embeddings.flush()
+        del embeddings
+        os.replace(tmp_path, self.embeddings_path)
+
+        self.embeddings = np.memmap(self.embeddings_path, dtype=np.float16, mode="r+",
+                                    shape=(self.capacity, self.dim))
+        self._dirty = True
+        self.flush()
+
+    def __contains__(self, speaker_id: str) -> bool:
+        return speaker_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, speaker_id: str) -> Optional[np.ndarray]:
+        """Embedding float16 dello speaker (copia), aggiornando l'ordine LRU; None se non presente."""
+        self.lookups += 1
+        entry = self.index.get(speaker_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry["last_used"] = time.time()
+        self.index.move_to_end(speaker_id)
+        self._dirty = True
+        return np.array(self.embeddings[entry["row"]])
+
+    def add(self, vector: np.ndarray, speaker_id: Optional[str] = None, preset: bool = False) -> str:
+        """Memorizza un embedding e ne restituisce l'id; se l'archivio è pieno rimuove il meno usato."""
+        vector = np.asarray(vector, dtype=np.float16).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding di dimensione {vector.shape[0]}, attesa {self.dim}")
+
+        speaker_id = speaker_id or uuid.uuid4().hex
+        entry = self.index.pop(speaker_id, None)
+        if entry is None:
+            if not self.free_rows:
+                self._evict()
+            now = time.time()
+            entry = {"row": self.free_rows.pop(), "preset": preset, "created_at": now, "last_used": now}
+        # Il flag segue l'ultima scrittura: un id sovrascritto da un utente torna rimovibile
+        entry["preset"] = preset
+        self.index[speaker_id] = entry
+
+        self.embeddings[entry["row"]] = vector
+        self.embeddings.flush()
+        self._dirty = True
+        self.flush()
+        return speaker_id
+
+    def remove(self, speaker_id: str) -> bool:
+        entry = self.index.pop(speaker_id, None)
+        if entry is None:
+            return False
+        self.free_rows.append(entry["row"])
+        self._dirty = True
+        self.flush()
+        return True
+
+    def retain_presets(self, names) -> List[str]:
+        """Declassa a speaker normali le voci preimpostate non più configurate; restituisce gli id declassati."""
+        demoted = [speaker_id for speaker_id, entry in self.index.items()
+                   if entry["preset"] and speaker_id not in names]
+        for speaker_id in demoted:
+            self.index[speaker_id]["preset"] = False
+        if demoted:
+            self._dirty = True
+            self.flush()
+        return demoted
+
+    def _evict(self):
+        for speaker_id, entry in self.index.items():
+            if not entry["preset"]:
+                del self.index[speaker_id]
+                self.free_rows.append(entry["row"])
+                self.evictions += 1
+                logger.info(f"Speaker {speaker_id} rimosso dall'archivio (capacità raggiunta)")
+                return
+        raise StoreFull(f"Archivio speaker pieno: {self.capacity} voci preimpostate")
+
+    def flush(self):
+        """Scrive l'indice su disco se è cambiato (in modo atomico)."""
+        if not self._dirty:
+            return
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "capacity": self.capacity,
+                # Lista ordinata: preserva l'ordine LRU tra un riavvio e l'altro
+                "speakers": list(self.index.items()),
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {"speaker_id": speaker_id, "preset": entry["preset"], "created_at": entry["created_at"],
+             "last_used": entry["last_used"]}
+            for speaker_id, entry in self.index.items()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "speakers": len(self.index),
+            "presets": sum(1 for entry in self.index.values() if entry["preset"]),
+            "capacity": self.capacity,
+            "dim": self.dim,
+            "bytes": self.capacity * self.dim * 2,
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
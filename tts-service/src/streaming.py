@@ -0,0 +1,90 @@
+"""Sintesi in streaming frase per frase.
+
+Il testo viene diviso in frasi; la prima viene sintetizzata da sola, così la
+riproduzione può iniziare il prima possibile, le successive vengono accodate
+insieme al worker (che le raggruppa in poche chiamate a `infer`) mentre il
+client riproduce la prima. I blocchi vengono restituiti sempre in ordine.
+"""
+import asyncio
+import re
+import struct
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+
+# Fine frase: punteggiatura forte seguita da spazio
+SENTENCE_END = re.compile(r"(?<=[.!?…;:])\s+")
+# Taglio secondario per frasi troppo lunghe
+CLAUSE_END = re.compile(r"(?<=[,])\s+")
+# Dimensione massima per i campi RIFF/data quando la lunghezza totale non è nota
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def split_sentences(text: str, min_chars: int = 20, max_chars: int = 200) -> List[str]:
+    """Divide il testo in frasi, unendo i frammenti troppo brevi e spezzando quelli troppo lunghi."""
+    sentences = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        if len(sentence) <= max_chars:
+            sentences.append(sentence)
+            continue
+        part = ""
+        for clause in CLAUSE_END.split(sentence):
+            if part and len(part) + len(clause) + 1 > max_chars:
+                sentences.append(part)
+                part = clause
+            else:
+                part = f"{part} {clause}" if part else clause
+        if part:
+            sentences.append(part)
+
+    merged: List[str] = []
+    for sentence in sentences:
+        if merged and len(merged[-1]) < min_chars:
+            merged[-1] = f"{merged[-1]} {sentence}"
+        else:
+            merged.append(sentence)
+    return [sentence for sentence in merged if sentence.strip()]
+
+
+def wav_header(sample_rate: int, channels: int = 1, bits: int = 16, data_size: int = UNKNOWN_SIZE) -> bytes:
+    """Intestazione WAV PCM; senza `data_size` la lunghezza resta indefinita (streaming)."""
+    byte_rate = sample_rate * channels * bits // 8
+    riff_size = UNKNOWN_SIZE if data_size == UNKNOWN_SIZE else 36 + data_size
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * bits // 8, bits)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def to_pcm16(wav: np.ndarray) -> bytes:
+    """Forma d'onda float in [-1, 1] -> PCM 16 bit little-endian mono."""
+    samples = np.clip(np.asarray(wav, dtype=np.float32).reshape(-1), -1.0, 1.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+async def synthesize_sentences(
+    worker,
+    sentences: List[str],
+    emotion: str,
+    speaker_id: Optional[str],
+    spk_emb: Any,
+) -> AsyncIterator[Tuple[int, str, bytes]]:
+    """Genera (indice, frase, PCM 16 bit) in ordine, sovrapponendo la sintesi alla riproduzione."""
+    if not sentences:
+        return
+
+    first = await worker.submit(sentences[0], emotion, speaker_id, spk_emb)
+    # Le frasi successive vengono accodate insieme solo dopo la prima, che non deve attendere il gruppo
+    rest = [
+        asyncio.ensure_future(worker.submit(sentence, emotion, speaker_id, spk_emb))
+        for sentence in sentences[1:]
+    ]
+    try:
+        yield 0, sentences[0], to_pcm16(first)
+        for index, task in enumerate(rest, start=1):
+            yield index, sentences[index], to_pcm16(await task)
+    finally:
+        # Client disconnesso: le frasi non ancora sintetizzate non servono più
+        for task in rest:
+            task.cancel()
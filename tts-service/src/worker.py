@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SynthesisJob:
+    def __init__(
+        self,
+        text: str,
+        emotion: str,
+        speaker_id: Optional[str],
+        spk_emb: Any,
+        future: asyncio.Future,
+        on_start: Optional[Callable[[], None]] = None,
+    ):
+        self.text = text
+        self.emotion = emotion
+        self.speaker_id = speaker_id
+        self.spk_emb = spk_emb
+        self.future = future
+        self.on_start = on_start
+
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        """Job con la stessa chiave condividono parametri ed embedding: una sola chiamata a `infer`."""
+        return self.emotion, self.speaker_id
+
+
+class SynthesisWorker:
+    """Raccoglie i job di sintesi in attesa e li esegue a gruppi su un thread dedicato.
+
+    Il worker attende al massimo `max_wait_ms` millisecondi, o finché non si
+    raggiungono `max_batch_size` job, poi raggruppa i job per (emozione, speaker)
+    e chiama `infer_fn(texts, emotion, spk_emb)` una volta per gruppo. L'event
+    loop resta libero per polling e health check durante la sintesi.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[List[str], str, Any], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 50.0,
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        # Un solo thread: il modello esegue un gruppo alla volta
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metriche
+        self.total_jobs = 0
+        self.total_calls = 0
+        self.total_errors = 0
+        self.total_infer_seconds = 0.0
+        self.max_queue_depth = 0
+        self.group_size_histogram: Dict[int, int] = {}
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._batch_ready = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Worker di sintesi avviato (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Worker di sintesi arrestato"))
+        self._executor.shutdown(wait=False)
+
+    async def submit(
+        self,
+        text: str,
+        emotion: str,
+        speaker_id: Optional[str] = None,
+        spk_emb: Any = None,
+        on_start: Optional[Callable[[], None]] = None,
+    ):
+        """Accoda un testo e attende la forma d'onda sintetizzata.
+
+        `on_start` viene chiamata sull'event loop quando il gruppo del job inizia la sintesi.
+        """
+        if self._worker is None:
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(SynthesisJob(text, emotion, speaker_id, spk_emb, future, on_start))
+        self.total_jobs += 1
+
+        depth = self._queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        # Il worker ha già prelevato il primo job del gruppo in formazione
+        if depth >= self.max_batch_size - 1:
+            self._batch_ready.set()
+
+        return await future
+
+    async def _run(self):
+        while True:
+            jobs = [await self._queue.get()]
+
+            # Attendi altri job finché il batch non è pieno o scade l'attesa
+            if self.max_wait > 0 and len(jobs) + self._queue.qsize() < self.max_batch_size:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            while len(jobs) < self.max_batch_size and not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+
+            groups: "OrderedDict[Tuple[str, Optional[str]], List[SynthesisJob]]" = OrderedDict()
+            for job in jobs:
+                if not job.future.cancelled():
+                    groups.setdefault(job.key, []).append(job)
+
+            for group in groups.values():
+                await self._process(group)
+
+    async def _process(self, jobs: List[SynthesisJob]):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        for job in jobs:
+            if job.on_start is not None:
+                job.on_start()
+        try:
+            wavs = await loop.run_in_executor(
+                self._executor, self.infer_fn, [job.text for job in jobs], jobs[0].emotion, jobs[0].spk_emb
+            )
+        except Exception as e:
+            logger.error(f"Errore durante la sintesi di un gruppo di {len(jobs)} testi: {e}")
+            self.total_errors += 1
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+
+        if wavs is None or len(wavs) != len(jobs):
+            # Un output mancante lascerebbe dei job in attesa per sempre: falliscono tutti
+            error = RuntimeError(
+                f"La sintesi ha restituito {0 if wavs is None else len(wavs)} audio per {len(jobs)} testi"
+            )
+            logger.error(str(error))
+            self.total_errors += 1
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(error)
+            return
+
+        for job, wav in zip(jobs, wavs):
+            if not job.future.done():
+                job.future.set_result(wav)
+
+        self.total_calls += 1
+        self.total_infer_seconds += time.perf_counter() - start
+        self.group_size_histogram[len(jobs)] = self.group_size_histogram.get(len(jobs), 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "total_jobs": self.total_jobs,
+            "total_infer_calls": self.total_calls,
+            "total_errors": self.total_errors,
+            "avg_texts_per_call": (
+                sum(size * count for size, count in self.group_size_histogram.items()) / self.total_calls
+                if self.total_calls else 0.0
+            ),
+            "avg_infer_ms": self.total_infer_seconds / self.total_calls * 1000 if self.total_calls else 0.0,
+            "group_size_histogram": dict(sorted(self.group_size_histogram.items())),
+        }